@@ -13,19 +13,65 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'encryption'))
 from SHA_function import create_sha_key
 from logistic_map import calculate_r_and_x
 from generate_weights import create_weights
-from forward_pass import Substitute, Perturbation, Substitute_Inv, Perturbation_Inv
-from Deferentail_Neural_network import DifferentialNeuralNetwork
+from forward_pass import (Substitute, Perturbation, Substitute_Inv, Perturbation_Inv,
+                          Substitute_Batch, Perturbation_Batch, Substitute_Inv_Batch,
+                          Perturbation_Inv_Batch)
+from Deferentail_Neural_network import (DifferentialNeuralNetwork, BatchedDifferentialNeuralNetwork,
+                                        decrypt_rows)
+from batcher import RequestBatcher
+from profiling import PROFILE_HEADER, RequestProfiler
+from cipher_suites import (CIPHER_SUITE_KEY, LEGACY_CIPHER_SUITE, CIPHER_SUITES, CipherSuite,
+                           register_cipher_suite, get_cipher_suite, suite_from_metadata)
+import cipher_v2
+from key_schedule import (KEY_SCHEDULE_KEY, LEGACY_KEY_SCHEDULE, KDF_KEY_SCHEDULE, KEY_SCHEDULES,
+                          derive_key, key_schedule_from_metadata)
+from cipher_container import (CHECKPOINTS_KEY, encode_checkpoints, decode_checkpoints,
+                              create_png_info, read_png_metadata)
 
 app = Flask(__name__)
 CORS(app=app)  # Enable CORS for frontend communication
 
-def encrypt_image(image_array, password):
+# Micro-batching of concurrent small-image requests (BATCH_MAX_SIZE <= 1 disables it)
+app.config['BATCH_MAX_SIZE'] = int(os.environ.get('BATCH_MAX_SIZE', 16))
+app.config['BATCH_MAX_WAIT_MS'] = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+app.config['BATCH_MAX_PIXELS'] = int(os.environ.get('BATCH_MAX_PIXELS', 256 * 256))
+app.config['BATCH_SMALL_PIXELS'] = int(os.environ.get('BATCH_SMALL_PIXELS', 64 * 64))
+app.config['BATCH_PIXEL_BUDGET'] = int(os.environ.get('BATCH_PIXEL_BUDGET', 4 * 256 * 256))
+
+# Worker processes for decrypting images with DNN checkpoints (<= 1 decrypts in the
+# request thread); the pool is started on first use and shared by all requests
+app.config['DECRYPT_WORKERS'] = int(os.environ.get('DECRYPT_WORKERS', os.cpu_count() or 1))
+
+# Cipher suite for new encryptions when the request does not choose one
+app.config['DEFAULT_CIPHER_SUITE'] = os.environ.get('DEFAULT_CIPHER_SUITE', LEGACY_CIPHER_SUITE)
+
+# New encryptions stretch the password into a fixed-size key ('kdf') so the cost
+# per request does not depend on its length. The legacy 'length' schedule, where
+# the DNN has len(password) neurons, is capped at MAX_LEGACY_KEY_LENGTH characters
+# for new encryptions. Decrypting 'length' ciphertexts (which includes every
+# untagged upload) has its own, larger cap, MAX_LEGACY_DECRYPT_KEY_LENGTH.
+app.config['DEFAULT_KEY_SCHEDULE'] = os.environ.get('DEFAULT_KEY_SCHEDULE', KDF_KEY_SCHEDULE)
+app.config['MAX_LEGACY_KEY_LENGTH'] = int(os.environ.get('MAX_LEGACY_KEY_LENGTH', 64))
+app.config['MAX_LEGACY_DECRYPT_KEY_LENGTH'] = int(os.environ.get('MAX_LEGACY_DECRYPT_KEY_LENGTH', 256))
+
+# On-demand profiling: a share of requests (PROFILE_SAMPLE_RATE) and requests with
+# an X-Profile header signed with PROFILE_SECRET run under cProfile. Off by default.
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_SECRET'] = os.environ.get('PROFILE_SECRET') or None
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
+app.config['PROFILE_MAX_FILES'] = int(os.environ.get('PROFILE_MAX_FILES', 50))
+
+def encrypt_image_v1(image_array, password, checkpoint_interval=0, metadata=None):
     """
-    Encrypts the image using the complete encryption pipeline.
+    Encrypts the image using the complete encryption pipeline (cipher suite v1).
     
     Args:
         image_array: numpy array of the image
         password: encryption key/password
+        checkpoint_interval: if > 0, record the DNN state every that many rows
+            so decryption can process row bands in parallel
+        metadata: optional dict, filled with the entries to store in the
+            ciphertext container (see cipher_container)
         
     Returns:
         encrypted_image: numpy array of encrypted image
@@ -41,8 +87,8 @@ def encrypt_image(image_array, password):
         T.append(substitute_block)
     T = np.array(T)
     
-    # Step 3: Perturbation
-    [c_perturbation, r_perturbation] = calculate_r_and_x(password)
+    # Step 3: Perturbation (same chaotic parameters as step 1)
+    [c_perturbation, r_perturbation] = [x, r]
     perturbed_image = Perturbation(T, r_perturbation, c_perturbation)
     
     # Step 4: Second Substitution
@@ -53,14 +99,29 @@ def encrypt_image(image_array, password):
     V = np.array(V)
     
     # Step 5: Differential Neural Network Encryption
+    return _dnn_encrypt_v1(V, password, x, checkpoint_interval, metadata)
+
+
+def _dnn_weights_v1(password, x):
+    """Number of neurons and chaotic weights of the v1 DNN for a password."""
     num_neurons = len(password)
     num_layers = 5  # 1 input + 3 hidden + 1 output
     total_weights_needed = (num_layers - 1) * (num_neurons * num_neurons)
-    W_i = create_weights(x, total_weights_needed)
+    return [num_neurons, create_weights(x, total_weights_needed)]
+
+
+def _dnn_encrypt_v1(V, password, x, checkpoint_interval=0, metadata=None):
+    """DNN stage of encrypt_image_v1: XORs every row of V with its blurring codes."""
+    [num_neurons, W_i] = _dnn_weights_v1(password, x)
     dnn = DifferentialNeuralNetwork(password, W_i, num_neurons=num_neurons)
     
     encrypted_rows = []
-    for v_i in V:
+    checkpoints = []
+    for row_index, v_i in enumerate(V):
+        # Record the DNN state at the start of every band but the first
+        if checkpoint_interval > 0 and row_index > 0 and row_index % checkpoint_interval == 0:
+            checkpoints.append(dnn.get_state())
+
         # Generate blurring codes for the current row
         codes = dnn.generate_codes_and_update(v_i)
         
@@ -70,17 +131,23 @@ def encrypt_image(image_array, password):
     
     # Combine all encrypted rows into the final matrix
     C_matrix = np.array(encrypted_rows, dtype=np.uint8)
+
+    if metadata is not None and checkpoint_interval > 0:
+        metadata[CHECKPOINTS_KEY] = encode_checkpoints(checkpoint_interval, checkpoints)
     
     return C_matrix
 
 
-def decrypt_image(encrypted_array, password):
+def decrypt_image_v1(encrypted_array, password, metadata=None, workers=None):
     """
-    Decrypts the image using the reverse encryption pipeline.
+    Decrypts the image using the reverse encryption pipeline (cipher suite v1).
     
     Args:
         encrypted_array: numpy array of the encrypted image
         password: decryption key/password
+        metadata: optional dict read from the ciphertext container; DNN
+            checkpoints found there are used to decrypt row bands in parallel
+        workers: number of worker processes for the DNN stage (default: CPU count)
         
     Returns:
         decrypted_image: numpy array of decrypted image
@@ -90,22 +157,7 @@ def decrypt_image(encrypted_array, password):
     [x, r] = calculate_r_and_x(password)
     
     # Step 2: Differential Neural Network Decryption
-    num_neurons = len(password)
-    num_layers = 5
-    total_weights_needed = (num_layers - 1) * (num_neurons * num_neurons)
-    W_i = create_weights(x, total_weights_needed)
-    dnn = DifferentialNeuralNetwork(password, W_i, num_neurons=num_neurons)
-    
-    decrypted_rows = []
-    for c_i in encrypted_array:
-        # Generate blurring codes for the current row
-        codes = dnn.generate_codes_and_update(c_i)
-        
-        # XOR to recover V
-        v_row = np.bitwise_xor(c_i, codes)
-        decrypted_rows.append(v_row)
-    
-    V = np.array(decrypted_rows, dtype=np.uint8)
+    V = _dnn_decrypt_v1(encrypted_array, password, x, metadata, workers)
     
     # Step 3: Inverse Second Substitution
     perturbed_image = []
@@ -114,8 +166,8 @@ def decrypt_image(encrypted_array, password):
         perturbed_image.append(inv_sub)
     perturbed_image = np.array(perturbed_image)
     
-    # Step 4: Inverse Perturbation
-    [c_perturbation, r_perturbation] = calculate_r_and_x(password)
+    # Step 4: Inverse Perturbation (same chaotic parameters as step 1)
+    [c_perturbation, r_perturbation] = [x, r]
     T = Perturbation_Inv(perturbed_image, r_perturbation, c_perturbation)
     
     # Step 5: Inverse First Substitution
@@ -128,6 +180,479 @@ def decrypt_image(encrypted_array, password):
     return original_image
 
 
+def _dnn_decrypt_v1(encrypted_array, password, x, metadata=None, workers=None):
+    """DNN stage of decrypt_image_v1, in parallel bands when metadata has checkpoints."""
+    [num_neurons, W_i] = _dnn_weights_v1(password, x)
+    interval, states = 0, []
+    if metadata and CHECKPOINTS_KEY in metadata:
+        [interval, states] = decode_checkpoints(metadata[CHECKPOINTS_KEY])
+    return decrypt_rows(password, W_i, num_neurons, encrypted_array, interval, states, workers)
+
+
+def rekey_image_v1(encrypted_array, old_password, new_password, checkpoint_interval=0, metadata=None,
+                   new_metadata=None, workers=None):
+    """
+    Re-encrypts a v1 ciphertext under a new password. The inverse pipeline of
+    the old password and the forward pipeline of the new one run back to back.
+    The first substitution does not depend on the password, so undoing and
+    redoing it is the identity: both are skipped, the output of the inverse
+    perturbation goes straight into the new perturbation, and the plain image
+    is never computed.
+    
+    Args:
+        encrypted_array: numpy array of the encrypted image
+        old_password: password the image is encrypted with
+        new_password: password to encrypt it with
+        checkpoint_interval: if > 0, record DNN checkpoints in the new ciphertext
+        metadata: container metadata of the ciphertext (DNN checkpoints)
+        new_metadata: optional dict, filled with the entries of the new container
+        workers: number of worker processes for the DNN decryption
+        
+    Returns:
+        numpy array of the re-encrypted image, identical to
+        encrypt_image_v1(decrypt_image_v1(encrypted_array, old_password), new_password)
+    """
+    # One chaotic schedule per password, shared by its DNN weights and perturbation
+    [old_x, old_r] = calculate_r_and_x(old_password)
+    [new_x, new_r] = calculate_r_and_x(new_password)
+    
+    # Old password: DNN, second substitution and perturbation inverted
+    V = _dnn_decrypt_v1(encrypted_array, old_password, old_x, metadata, workers)
+    perturbed_image = np.array([Substitute_Inv(v) for v in V])
+    T = Perturbation_Inv(perturbed_image, old_r, old_x)
+    
+    # New password: perturbation, second substitution and DNN
+    perturbed_image = Perturbation(T, new_r, new_x)
+    V = np.array([Substitute(p) for p in perturbed_image])
+    return _dnn_encrypt_v1(V, new_password, new_x, checkpoint_interval, new_metadata)
+
+
+def _batch_schedule(passwords):
+    """Per image chaotic parameters and DNN weights for a batch."""
+    num_neurons = len(passwords[0])
+    num_layers = 5
+    total_weights_needed = (num_layers - 1) * (num_neurons * num_neurons)
+    schedules = [calculate_r_and_x(password) for password in passwords]
+    weights = [create_weights(x, total_weights_needed) for [x, r] in schedules]
+    c_perturbation = [x for [x, r] in schedules]
+    r_perturbation = [r for [x, r] in schedules]
+    return [num_neurons, weights, r_perturbation, c_perturbation]
+
+
+def encrypt_images_batch_v1(image_arrays, passwords):
+    """
+    Encrypts several images in one vectorized pass. All images must have the
+    same shape and all passwords the same length; each result is identical
+    to encrypt_image_v1(image_array, password).
+    
+    Args:
+        image_arrays: B x N x M array (or list of N x M arrays)
+        passwords: list of B passwords
+        
+    Returns:
+        B x N x M uint8 array of encrypted images
+    """
+    images = np.asarray(image_arrays)
+    B, N, M = images.shape
+    [num_neurons, weights, r_perturbation, c_perturbation] = _batch_schedule(passwords)
+    
+    # Substitution, perturbation and substitution with one lane per row / image
+    T = Substitute_Batch(images.reshape(B * N, M)).reshape(B, N, M)
+    perturbed_images = Perturbation_Batch(T, r_perturbation, c_perturbation)
+    V = Substitute_Batch(perturbed_images.reshape(B * N, M)).reshape(B, N, M)
+    
+    # Differential Neural Network Encryption, one lane per image
+    return _dnn_encrypt_batch_v1(V, passwords, weights, num_neurons)
+
+
+def _dnn_encrypt_batch_v1(V, passwords, weights, num_neurons):
+    """DNN stage of encrypt_images_batch_v1."""
+    B, N, M = V.shape
+    dnn = BatchedDifferentialNeuralNetwork(passwords, weights, num_neurons=num_neurons)
+    C = np.empty((B, N, M), dtype=np.uint8)
+    for row_index in range(N):
+        v_rows = V[:, row_index, :].astype(np.uint8)
+        C[:, row_index, :] = np.bitwise_xor(v_rows, dnn.generate_codes_and_update(v_rows))
+    return C
+
+
+def _dnn_decrypt_batch_v1(encrypted, passwords, weights, num_neurons):
+    """DNN stage of decrypt_images_batch_v1."""
+    B, N, M = encrypted.shape
+    dnn = BatchedDifferentialNeuralNetwork(passwords, weights, num_neurons=num_neurons)
+    V = np.empty((B, N, M), dtype=np.uint8)
+    for row_index in range(N):
+        V[:, row_index, :] = dnn.recover_blocks_and_update(encrypted[:, row_index, :])
+    return V
+
+
+def decrypt_images_batch_v1(encrypted_arrays, passwords):
+    """
+    Decrypts several images in one vectorized pass, see encrypt_images_batch_v1.
+    
+    Returns:
+        B x N x M uint8 array of decrypted images
+    """
+    encrypted = np.asarray(encrypted_arrays).astype(np.uint8)
+    B, N, M = encrypted.shape
+    [num_neurons, weights, r_perturbation, c_perturbation] = _batch_schedule(passwords)
+    
+    V = _dnn_decrypt_batch_v1(encrypted, passwords, weights, num_neurons)
+    
+    perturbed_images = Substitute_Inv_Batch(V.reshape(B * N, M)).reshape(B, N, M)
+    T = Perturbation_Inv_Batch(perturbed_images, r_perturbation, c_perturbation)
+    original_images = Substitute_Inv_Batch(T.reshape(B * N, M)).reshape(B, N, M)
+    
+    return original_images.astype(np.uint8)
+
+
+def rekey_images_batch_v1(encrypted_arrays, old_passwords, new_passwords):
+    """
+    Re-keys several images in one vectorized pass, like rekey_image_v1: the
+    keyless first substitution is skipped, so no plain image is computed. All
+    images must have the same shape, and the old and the new passwords the same
+    length among themselves.
+    
+    Returns:
+        B x N x M uint8 array of re-encrypted images
+    """
+    encrypted = np.asarray(encrypted_arrays).astype(np.uint8)
+    B, N, M = encrypted.shape
+    [old_neurons, old_weights, old_r, old_c] = _batch_schedule(old_passwords)
+    [new_neurons, new_weights, new_r, new_c] = _batch_schedule(new_passwords)
+    
+    V = _dnn_decrypt_batch_v1(encrypted, old_passwords, old_weights, old_neurons)
+    perturbed_images = Substitute_Inv_Batch(V.reshape(B * N, M)).reshape(B, N, M)
+    T = Perturbation_Inv_Batch(perturbed_images, old_r, old_c)
+    
+    perturbed_images = Perturbation_Batch(T, new_r, new_c)
+    V = Substitute_Batch(perturbed_images.reshape(B * N, M)).reshape(B, N, M)
+    return _dnn_encrypt_batch_v1(V, new_passwords, new_weights, new_neurons)
+
+
+register_cipher_suite(CipherSuite(
+    'v1', encrypt_image_v1, decrypt_image_v1, encrypt_images_batch_v1, decrypt_images_batch_v1,
+    description='Original algorithm: logistic map key schedule, float64 DNN',
+    rekey=rekey_image_v1, rekey_batch=rekey_images_batch_v1,
+))
+register_cipher_suite(CipherSuite(
+    'v2', cipher_v2.encrypt_image, cipher_v2.decrypt_image,
+    cipher_v2.encrypt_images_batch, cipher_v2.decrypt_images_batch,
+    description='Integer-only arithmetic, keyed permutation, vectorized',
+    rekey=cipher_v2.rekey_image, rekey_batch=cipher_v2.rekey_images_batch,
+))
+
+# Misconfigured defaults would otherwise only fail on the first request
+if app.config['DEFAULT_CIPHER_SUITE'] not in CIPHER_SUITES:
+    raise ValueError(f"DEFAULT_CIPHER_SUITE must be one of: {', '.join(sorted(CIPHER_SUITES))}")
+if app.config['DEFAULT_KEY_SCHEDULE'] not in KEY_SCHEDULES:
+    raise ValueError(f"DEFAULT_KEY_SCHEDULE must be one of: {', '.join(KEY_SCHEDULES)}")
+
+
+def resolve_key_schedule(operation, key_schedule=None, metadata=None):
+    """
+    Key schedule of a request: the requested one (or DEFAULT_KEY_SCHEDULE) for
+    encryption, the one recorded in the container for decryption.
+    """
+    if operation == 'encrypt':
+        return key_schedule or app.config['DEFAULT_KEY_SCHEDULE']
+    return key_schedule_from_metadata(metadata, key_schedule or LEGACY_KEY_SCHEDULE)
+
+
+def checkpoint_schedule_error(checkpoint_interval, key_schedule=None):
+    """
+    With the 'length' key schedule every DNN checkpoint is 2 * len(key) bytes, so
+    the dnn_checkpoints chunk would reveal the key length: checkpoints require
+    the 'kdf' schedule.
+
+    Returns:
+        an error message, or None if the combination is accepted
+    """
+    if checkpoint_interval > 0 and resolve_key_schedule('encrypt', key_schedule) == LEGACY_KEY_SCHEDULE:
+        return ("checkpoint_interval requires the 'kdf' key schedule "
+                "('length' checkpoints reveal the key length)")
+    return None
+
+
+def _prepare_encryption(password, metadata, cipher_suite, key_schedule, checkpoint_interval=0):
+    """Resolves suite and key for an encryption and tags the container metadata."""
+    error = checkpoint_schedule_error(checkpoint_interval, key_schedule)
+    if error:
+        raise ValueError(error)
+    suite = get_cipher_suite(cipher_suite or app.config['DEFAULT_CIPHER_SUITE'])
+    key_schedule = resolve_key_schedule('encrypt', key_schedule)
+    key = derive_key(password, key_schedule)
+    if metadata is not None:
+        metadata[CIPHER_SUITE_KEY] = suite.name
+        metadata[KEY_SCHEDULE_KEY] = key_schedule
+    return [suite, key]
+
+
+def _prepare_decryption(password, metadata, cipher_suite, key_schedule):
+    """Resolves suite and key for a decryption from the container metadata."""
+    suite = get_cipher_suite(suite_from_metadata(metadata, cipher_suite or LEGACY_CIPHER_SUITE))
+    key = derive_key(password, resolve_key_schedule('decrypt', key_schedule, metadata))
+    return [suite, key]
+
+
+def encrypt_image(image_array, password, checkpoint_interval=0, metadata=None, cipher_suite=None,
+                  key_schedule=None):
+    """
+    Encrypts the image with the given cipher suite and key schedule.
+    
+    Args:
+        image_array: numpy array of the image
+        password: encryption key/password
+        checkpoint_interval: if > 0, record the DNN state every that many rows
+        metadata: optional dict, filled with the entries to store in the
+            ciphertext container, including the cipher suite and key schedule tags
+        cipher_suite: suite name, defaults to DEFAULT_CIPHER_SUITE
+        key_schedule: 'kdf' or 'length', defaults to DEFAULT_KEY_SCHEDULE
+        
+    Returns:
+        encrypted_image: numpy array of encrypted image
+    """
+    [suite, key] = _prepare_encryption(password, metadata, cipher_suite, key_schedule, checkpoint_interval)
+    return suite.encrypt(image_array, key, checkpoint_interval, metadata)
+
+
+def decrypt_image(encrypted_array, password, metadata=None, workers=None, cipher_suite=None,
+                  key_schedule=None):
+    """
+    Decrypts the image with the cipher suite and key schedule recorded in its container.
+    
+    Args:
+        encrypted_array: numpy array of the encrypted image
+        password: decryption key/password
+        metadata: optional dict read from the ciphertext container
+        workers: number of worker processes for the DNN stage
+        cipher_suite: suite to use when the metadata carries no tag (default v1)
+        key_schedule: key schedule to use when the metadata carries no tag (default 'length')
+        
+    Returns:
+        decrypted_image: numpy array of decrypted image
+    """
+    [suite, key] = _prepare_decryption(password, metadata, cipher_suite, key_schedule)
+    return suite.decrypt(encrypted_array, key, metadata, workers)
+
+
+def _rekey(old_suite, new_suite, encrypted_array, old_key, new_key, checkpoint_interval, metadata,
+           new_metadata, workers):
+    # Same suite on both sides: its fused pass; otherwise decrypt then encrypt
+    if old_suite is new_suite and new_suite.rekey is not None:
+        return new_suite.rekey(encrypted_array, old_key, new_key, checkpoint_interval, metadata,
+                               new_metadata, workers)
+    image_array = old_suite.decrypt(encrypted_array, old_key, metadata, workers)
+    return new_suite.encrypt(image_array, new_key, checkpoint_interval, new_metadata)
+
+
+def rekey_image(encrypted_array, old_password, new_password, metadata=None, new_metadata=None,
+                checkpoint_interval=0, workers=None, cipher_suite=None, key_schedule=None):
+    """
+    Re-encrypts a ciphertext under a new password; only the new ciphertext is returned.
+    
+    Args:
+        encrypted_array: numpy array of the encrypted image
+        old_password: password the image is encrypted with
+        new_password: password to encrypt it with
+        metadata: container metadata of the ciphertext; its cipher suite and key
+            schedule tags select the decryption (untagged images are v1 / 'length')
+        new_metadata: optional dict, filled with the entries of the new container
+        checkpoint_interval: if > 0, record DNN checkpoints in the new ciphertext
+        workers: number of worker processes for the DNN decryption
+        cipher_suite: suite to migrate the image to; by default it keeps its own suite
+        key_schedule: key schedule of the new ciphertext, defaults to DEFAULT_KEY_SCHEDULE
+        
+    Returns:
+        numpy array of the re-encrypted image
+    """
+    [old_suite, old_key] = _prepare_decryption(old_password, metadata, None, None)
+    [new_suite, new_key] = _prepare_encryption(new_password, new_metadata, cipher_suite or old_suite.name,
+                                               key_schedule, checkpoint_interval)
+    return _rekey(old_suite, new_suite, encrypted_array, old_key, new_key, checkpoint_interval, metadata,
+                  new_metadata, workers)
+
+
+def rekey_images(encrypted_arrays, old_passwords, new_passwords, metadatas=None, checkpoint_interval=0,
+                 cipher_suite=None, key_schedule=None):
+    """
+    Re-keys a whole store of ciphertexts.
+    
+    Every password is stretched once per key schedule, however many images use
+    it. Images keep their own suite unless cipher_suite migrates them. Small
+    images (up to BATCH_MAX_PIXELS) that stay in their suite and share suite,
+    shape and key lengths are re-keyed BATCH_MAX_SIZE at a time with the
+    suite's fused rekey_batch kernel. The others, and all of them when
+    checkpoint_interval > 0, go one by one through rekey_image (fused within a
+    suite, decrypt then encrypt across suites).
+    
+    Args:
+        encrypted_arrays: list of N x M ciphertext arrays
+        old_passwords: one password for every image, or a list with one per image
+        new_passwords: one password for every image, or a list with one per image
+        metadatas: list of container metadata dicts, one per image (default: untagged)
+        checkpoint_interval, cipher_suite, key_schedule: as for rekey_image
+        
+    Returns:
+        [ciphertexts, new_metadatas]: lists in the order of encrypted_arrays
+    """
+    count = len(encrypted_arrays)
+    if isinstance(old_passwords, str):
+        old_passwords = [old_passwords] * count
+    if isinstance(new_passwords, str):
+        new_passwords = [new_passwords] * count
+    if metadatas is None:
+        metadatas = [None] * count
+    
+    error = checkpoint_schedule_error(checkpoint_interval, key_schedule)
+    if error:
+        raise ValueError(error)
+    
+    keys = {}
+    def derive_once(password, schedule):
+        if (password, schedule) not in keys:
+            keys[(password, schedule)] = derive_key(password, schedule)
+        return keys[(password, schedule)]
+    
+    target_suite = get_cipher_suite(cipher_suite) if cipher_suite else None
+    new_schedule = resolve_key_schedule('encrypt', key_schedule)
+    new_metadatas = [{KEY_SCHEDULE_KEY: new_schedule} for _ in range(count)]
+    ciphertexts = [None] * count
+    
+    groups = {}
+    for index, (encrypted_array, metadata) in enumerate(zip(encrypted_arrays, metadatas)):
+        encrypted_array = np.asarray(encrypted_array, dtype=np.uint8)
+        old_suite = get_cipher_suite(suite_from_metadata(metadata))
+        new_suite = target_suite or old_suite
+        new_metadatas[index][CIPHER_SUITE_KEY] = new_suite.name
+        old_key = derive_once(old_passwords[index], resolve_key_schedule('decrypt', None, metadata))
+        new_key = derive_once(new_passwords[index], new_schedule)
+        if (old_suite is new_suite and new_suite.rekey_batch is not None and checkpoint_interval == 0
+                and batcher.enabled and encrypted_array.ndim == 2 and encrypted_array.size <= batcher.max_pixels):
+            group = (new_suite.name, encrypted_array.shape, len(old_key), len(new_key))
+            groups.setdefault(group, []).append((index, encrypted_array, old_key, new_key))
+        else:
+            ciphertexts[index] = _rekey(old_suite, new_suite, encrypted_array, old_key, new_key,
+                                        checkpoint_interval, metadata, new_metadatas[index],
+                                        app.config['DECRYPT_WORKERS'])
+    
+    for (suite_name, _, _, _), items in groups.items():
+        new_suite = get_cipher_suite(suite_name)
+        for start in range(0, len(items), batcher.max_batch_size):
+            chunk = items[start:start + batcher.max_batch_size]
+            results = new_suite.rekey_batch(np.stack([item[1] for item in chunk]),
+                                            [item[2] for item in chunk], [item[3] for item in chunk])
+            for item, result in zip(chunk, results):
+                ciphertexts[item[0]] = result
+    
+    return [ciphertexts, new_metadatas]
+
+
+batcher = RequestBatcher(
+    {(operation, name): suite.encrypt_batch if operation == 'encrypt' else suite.decrypt_batch
+     for name, suite in CIPHER_SUITES.items() for operation in ['encrypt', 'decrypt']},
+    max_batch_size=app.config['BATCH_MAX_SIZE'],
+    max_wait_ms=app.config['BATCH_MAX_WAIT_MS'],
+    max_pixels=app.config['BATCH_MAX_PIXELS'],
+    small_pixels=app.config['BATCH_SMALL_PIXELS'],
+    max_batch_pixels=app.config['BATCH_PIXEL_BUDGET'],
+)
+
+profiler = RequestProfiler(
+    app.config['PROFILE_DIR'],
+    max_profiles=app.config['PROFILE_MAX_FILES'],
+    sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+    secret=app.config['PROFILE_SECRET'],
+)
+
+
+def process_array(operation, image_array, password, checkpoint_interval, metadata, cipher_suite=None,
+                  key_schedule=None, profile=False, use_batcher=True):
+    """
+    Runs one request's encryption or decryption. Small images without DNN
+    checkpoints go through the request batcher, everything else runs directly.
+    
+    Args:
+        operation: 'encrypt' or 'decrypt'
+        metadata: container metadata; read for decrypt, filled for encrypt
+        cipher_suite: requested suite (encrypt) or fallback for untagged images (decrypt)
+        key_schedule: requested key schedule (encrypt) or fallback for untagged images (decrypt)
+        profile: run under cProfile and store the capture (see profiling)
+        use_batcher: allow the request batcher
+        
+    Returns:
+        processed image array
+    """
+    if profile:
+        # Profiled requests bypass the batcher so the capture shows the actual work
+        info = {'operation': operation, 'height': int(image_array.shape[0]), 'width': int(image_array.shape[1]),
+                'checkpoint_interval': checkpoint_interval}
+        return profiler.run(info, process_array, operation, image_array, password, checkpoint_interval,
+                            metadata, cipher_suite, key_schedule, use_batcher=False)
+    
+    if operation == 'encrypt':
+        [suite, key] = _prepare_encryption(password, metadata, cipher_suite, key_schedule, checkpoint_interval)
+        if use_batcher and checkpoint_interval == 0 and batcher.accepts((operation, suite.name), image_array):
+            return batcher.submit((operation, suite.name), image_array, key).result()
+        return suite.encrypt(image_array, key, checkpoint_interval, metadata)
+    
+    # Checkpoints only speed up the DNN stage; the batched result is identical
+    [suite, key] = _prepare_decryption(password, metadata, cipher_suite, key_schedule)
+    if use_batcher and batcher.accepts((operation, suite.name), image_array):
+        return batcher.submit((operation, suite.name), image_array, key).result()
+    return suite.decrypt(image_array, key, metadata, app.config['DECRYPT_WORKERS'])
+
+
+def parse_checkpoint_interval(value):
+    """
+    Parses the optional checkpoint_interval request field.
+
+    Returns:
+        the interval as an int (0 disables checkpoints), or None if invalid
+    """
+    try:
+        interval = int(value)
+    except (TypeError, ValueError):
+        return None
+    return interval if interval >= 0 else None
+
+
+def metadata_tag_error(metadata):
+    """
+    Checks the cipher suite and key schedule tags of an uploaded container, which
+    come from untrusted PNG text chunks.
+
+    Returns:
+        an error message, or None if the tags are known (or absent)
+    """
+    if suite_from_metadata(metadata) not in CIPHER_SUITES:
+        return f'Unknown cipher suite in image metadata. Must be one of: {", ".join(sorted(CIPHER_SUITES))}'
+    if key_schedule_from_metadata(metadata) not in KEY_SCHEDULES:
+        return f'Unknown key schedule in image metadata. Must be one of: {", ".join(KEY_SCHEDULES)}'
+    return None
+
+
+def legacy_key_length_error(operation, key, key_schedule=None, metadata=None):
+    """
+    The legacy key schedule costs O(len(key)^2) per row, so key lengths are capped
+    before any key material is derived: MAX_LEGACY_KEY_LENGTH for new encryptions,
+    MAX_LEGACY_DECRYPT_KEY_LENGTH for decrypting 'length' (or untagged) ciphertexts.
+
+    Returns:
+        an error message, or None if the key is accepted
+    """
+    if resolve_key_schedule(operation, key_schedule, metadata) != LEGACY_KEY_SCHEDULE:
+        return None
+    if operation == 'encrypt':
+        if len(key) > app.config['MAX_LEGACY_KEY_LENGTH']:
+            return (f"Keys longer than {app.config['MAX_LEGACY_KEY_LENGTH']} characters "
+                    f"require the 'kdf' key schedule")
+    elif len(key) > app.config['MAX_LEGACY_DECRYPT_KEY_LENGTH']:
+        return (f"Keys longer than {app.config['MAX_LEGACY_DECRYPT_KEY_LENGTH']} characters "
+                f"cannot decrypt 'length' key schedule images")
+    return None
+
+
 @app.route('/api/process', methods=['POST'])
 def process_image():
     """
@@ -137,6 +662,9 @@ def process_image():
         - image: image file
         - key: encryption/decryption key (string)
         - operation: 'encrypt' or 'decrypt'
+        - checkpoint_interval: optional, rows between DNN checkpoints (encrypt only)
+        - cipher_suite: optional, 'v1' or 'v2' (encrypt; fallback for untagged images on decrypt)
+        - key_schedule: optional, 'kdf' or 'length' (encrypt; fallback for untagged images on decrypt)
     
     Returns:
         JSON response with base64 encoded processed image
@@ -165,16 +693,54 @@ def process_image():
         if len(encryption_key) < 8:
             return jsonify({'error': 'Encryption key must be at least 8 characters long'}), 400
         
+        # Validate checkpoint interval
+        checkpoint_interval = parse_checkpoint_interval(request.form.get('checkpoint_interval', 0))
+        if checkpoint_interval is None:
+            return jsonify({'error': 'checkpoint_interval must be a non-negative integer'}), 400
+
+        # Validate cipher suite
+        cipher_suite = request.form.get('cipher_suite') or None
+        if cipher_suite is not None and cipher_suite not in CIPHER_SUITES:
+            return jsonify({'error': f'Unknown cipher suite. Must be one of: {", ".join(sorted(CIPHER_SUITES))}'}), 400
+
+        # Validate key schedule
+        key_schedule = request.form.get('key_schedule') or None
+        if key_schedule is not None and key_schedule not in KEY_SCHEDULES:
+            return jsonify({'error': f'Unknown key schedule. Must be one of: {", ".join(KEY_SCHEDULES)}'}), 400
+        
         # Read and process image
-        image = Image.open(image_file.stream).convert('L')  # Convert to grayscale
-        image_array = np.array(image)
+        image = Image.open(image_file.stream)
+        metadata = read_png_metadata(image)
+        image_array = np.array(image.convert('L'))  # Convert to grayscale
+        
+        # The container tags are untrusted input (see metadata_tag_error)
+        if operation == 'decrypt':
+            tag_error = metadata_tag_error(metadata)
+            if tag_error:
+                return jsonify({'error': tag_error}), 400
+        
+        # Legacy key schedule keys are length-capped (see legacy_key_length_error)
+        key_error = legacy_key_length_error(operation, encryption_key, key_schedule, metadata)
+        if key_error:
+            return jsonify({'error': key_error}), 400
+        if operation == 'encrypt':
+            checkpoint_error = checkpoint_schedule_error(checkpoint_interval, key_schedule)
+            if checkpoint_error:
+                return jsonify({'error': checkpoint_error}), 400
         
+        # Profiling is decided per request; it costs nothing when disabled
+        profile = profiler.enabled and profiler.should_profile(request.headers.get(PROFILE_HEADER))
+
         # Process image based on operation
         if operation == 'encrypt':
-            processed_array = encrypt_image(image_array, encryption_key)
+            metadata = {}
+            processed_array = process_array(operation, image_array, encryption_key, checkpoint_interval, metadata,
+                                            cipher_suite, key_schedule, profile)
             message = 'Image encrypted successfully'
         else:  # decrypt
-            processed_array = decrypt_image(image_array, encryption_key)
+            processed_array = process_array(operation, image_array, encryption_key, checkpoint_interval, metadata,
+                                            cipher_suite, key_schedule, profile)
+            metadata = {}
             message = 'Image decrypted successfully'
         
         # Convert processed array back to image
@@ -182,7 +748,7 @@ def process_image():
         
         # Convert to base64 for JSON response
         buffered = io.BytesIO()
-        processed_image.save(buffered, format="PNG")
+        processed_image.save(buffered, format="PNG", pnginfo=create_png_info(metadata))
         img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
         
         return jsonify({
@@ -208,6 +774,9 @@ def process_image_base64():
         - image: base64 encoded image string
         - key: encryption/decryption key (string)
         - operation: 'encrypt' or 'decrypt'
+        - checkpoint_interval: optional, rows between DNN checkpoints (encrypt only)
+        - cipher_suite: optional, 'v1' or 'v2' (encrypt; fallback for untagged images on decrypt)
+        - key_schedule: optional, 'kdf' or 'length' (encrypt; fallback for untagged images on decrypt)
 
     Returns:
         JSON response with base64 encoded processed image
@@ -216,7 +785,6 @@ def process_image_base64():
     try:
         # Get JSON data
         data = request.get_json()
-        print("Data received:", data)
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
 
@@ -242,20 +810,58 @@ def process_image_base64():
         if len(encryption_key) < 8:
             return jsonify({'error': 'Encryption key must be at least 8 characters long'}), 400
 
+        # Validate checkpoint interval
+        checkpoint_interval = parse_checkpoint_interval(data.get('checkpoint_interval', 0))
+        if checkpoint_interval is None:
+            return jsonify({'error': 'checkpoint_interval must be a non-negative integer'}), 400
+
+        # Validate cipher suite
+        cipher_suite = data.get('cipher_suite') or None
+        if cipher_suite is not None and cipher_suite not in CIPHER_SUITES:
+            return jsonify({'error': f'Unknown cipher suite. Must be one of: {", ".join(sorted(CIPHER_SUITES))}'}), 400
+
+        # Validate key schedule
+        key_schedule = data.get('key_schedule') or None
+        if key_schedule is not None and key_schedule not in KEY_SCHEDULES:
+            return jsonify({'error': f'Unknown key schedule. Must be one of: {", ".join(KEY_SCHEDULES)}'}), 400
+
         # Decode base64 image
         try:
             image_bytes = base64.b64decode(image_base64)
-            image = Image.open(io.BytesIO(image_bytes)).convert('L')  # Convert to grayscale
-            image_array = np.array(image)
+            image = Image.open(io.BytesIO(image_bytes))
+            metadata = read_png_metadata(image)
+            image_array = np.array(image.convert('L'))  # Convert to grayscale
         except Exception as e:
             return jsonify({'error': f'Invalid base64 image: {str(e)}'}), 400
 
+        # The container tags are untrusted input (see metadata_tag_error)
+        if operation == 'decrypt':
+            tag_error = metadata_tag_error(metadata)
+            if tag_error:
+                return jsonify({'error': tag_error}), 400
+        
+        # Legacy key schedule keys are length-capped (see legacy_key_length_error)
+        key_error = legacy_key_length_error(operation, encryption_key, key_schedule, metadata)
+        if key_error:
+            return jsonify({'error': key_error}), 400
+        if operation == 'encrypt':
+            checkpoint_error = checkpoint_schedule_error(checkpoint_interval, key_schedule)
+            if checkpoint_error:
+                return jsonify({'error': checkpoint_error}), 400
+
+        # Profiling is decided per request; it costs nothing when disabled
+        profile = profiler.enabled and profiler.should_profile(request.headers.get(PROFILE_HEADER))
+
         # Process image based on operation
         if operation == 'encrypt':
-            processed_array = encrypt_image(image_array, encryption_key)
+            metadata = {}
+            processed_array = process_array(operation, image_array, encryption_key, checkpoint_interval, metadata,
+                                            cipher_suite, key_schedule, profile)
             message = 'Image encrypted successfully'
         else:  # decrypt
-            processed_array = decrypt_image(image_array, encryption_key)
+            processed_array = process_array(operation, image_array, encryption_key, checkpoint_interval, metadata,
+                                            cipher_suite, key_schedule, profile)
+            metadata = {}
             message = 'Image decrypted successfully'
 
         # Convert processed array back to image
@@ -263,9 +869,8 @@ def process_image_base64():
 
         # Convert to base64 for JSON response
         buffered = io.BytesIO()
-        processed_image.save(buffered, format="PNG")
+        processed_image.save(buffered, format="PNG", pnginfo=create_png_info(metadata))
         img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        print(image_base64)
         return jsonify({
             'success': True,
             'message': message,
@@ -280,6 +885,148 @@ def process_image_base64():
         }), 500
 
 
+def _decode_base64_image(image_base64):
+    """Returns [grayscale array, PNG metadata] of a base64 encoded image."""
+    image = Image.open(io.BytesIO(base64.b64decode(image_base64)))
+    metadata = read_png_metadata(image)
+    return [np.array(image.convert('L')), metadata]
+
+
+def _encode_base64_png(image_array, metadata):
+    """Returns a PNG data URL of the array, with the metadata as text chunks."""
+    buffered = io.BytesIO()
+    Image.fromarray(image_array.astype(np.uint8)).save(buffered, format="PNG", pnginfo=create_png_info(metadata))
+    return f'data:image/png;base64,{base64.b64encode(buffered.getvalue()).decode("utf-8")}'
+
+
+@app.route('/api/rekey', methods=['POST'])
+def rekey():
+    """
+    POST endpoint to re-encrypt images under a new key without returning the plain images.
+    
+    Expected JSON data:
+        - image: base64 encoded encrypted image, or
+        - images: list of base64 encoded encrypted images (batch mode)
+        - old_key: key the images are encrypted with
+        - new_key: key to encrypt them with
+        - checkpoint_interval: optional, rows between DNN checkpoints of the new ciphertexts
+        - cipher_suite: optional, migrates the images to this suite, 'v1' or 'v2'
+          (by default each image keeps its own)
+        - key_schedule: optional, key schedule of the new ciphertexts, 'kdf' or 'length'
+    
+    Returns:
+        JSON response with the base64 encoded re-encrypted image(s)
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        if 'image' not in data and 'images' not in data:
+            return jsonify({'error': 'No image base64 provided'}), 400
+        
+        if 'old_key' not in data or 'new_key' not in data:
+            return jsonify({'error': 'Both old_key and new_key must be provided'}), 400
+        
+        old_key = data['old_key']
+        new_key = data['new_key']
+        batch = 'images' in data
+        images_base64 = data['images'] if batch else [data['image']]
+        
+        if not isinstance(images_base64, list) or not images_base64:
+            return jsonify({'error': 'images must be a non-empty list'}), 400
+        
+        # Validate key length
+        if len(old_key) < 8 or len(new_key) < 8:
+            return jsonify({'error': 'Encryption key must be at least 8 characters long'}), 400
+        
+        # Validate checkpoint interval
+        checkpoint_interval = parse_checkpoint_interval(data.get('checkpoint_interval', 0))
+        if checkpoint_interval is None:
+            return jsonify({'error': 'checkpoint_interval must be a non-negative integer'}), 400
+        
+        # Validate cipher suite
+        cipher_suite = data.get('cipher_suite') or None
+        if cipher_suite is not None and cipher_suite not in CIPHER_SUITES:
+            return jsonify({'error': f'Unknown cipher suite. Must be one of: {", ".join(sorted(CIPHER_SUITES))}'}), 400
+        
+        # Validate key schedule
+        key_schedule = data.get('key_schedule') or None
+        if key_schedule is not None and key_schedule not in KEY_SCHEDULES:
+            return jsonify({'error': f'Unknown key schedule. Must be one of: {", ".join(KEY_SCHEDULES)}'}), 400
+        
+        # Decode base64 images
+        try:
+            [encrypted_arrays, metadatas] = [list(values) for values in
+                                             zip(*[_decode_base64_image(text) for text in images_base64])]
+        except Exception as e:
+            return jsonify({'error': f'Invalid base64 image: {str(e)}'}), 400
+        
+        # The container tags are untrusted input (see metadata_tag_error)
+        tag_error = next(filter(None, map(metadata_tag_error, metadatas)), None)
+        if tag_error:
+            return jsonify({'error': tag_error}), 400
+        
+        # Legacy key schedule keys are length-capped (see legacy_key_length_error)
+        key_error = (legacy_key_length_error('encrypt', new_key, key_schedule)
+                     or next(filter(None, (legacy_key_length_error('decrypt', old_key, None, metadata)
+                                           for metadata in metadatas)), None))
+        if key_error:
+            return jsonify({'error': key_error}), 400
+        checkpoint_error = checkpoint_schedule_error(checkpoint_interval, key_schedule)
+        if checkpoint_error:
+            return jsonify({'error': checkpoint_error}), 400
+        
+        arguments = (encrypted_arrays, old_key, new_key, metadatas, checkpoint_interval, cipher_suite, key_schedule)
+        if profiler.enabled and profiler.should_profile(request.headers.get(PROFILE_HEADER)):
+            info = {'operation': 'rekey', 'images': len(encrypted_arrays),
+                    'height': int(encrypted_arrays[0].shape[0]), 'width': int(encrypted_arrays[0].shape[1]),
+                    'checkpoint_interval': checkpoint_interval}
+            [ciphertexts, new_metadatas] = profiler.run(info, rekey_images, *arguments)
+        else:
+            [ciphertexts, new_metadatas] = rekey_images(*arguments)
+        
+        images = [_encode_base64_png(ciphertext, metadata)
+                  for ciphertext, metadata in zip(ciphertexts, new_metadatas)]
+        response = {'success': True, 'message': f'{len(images)} image(s) re-keyed successfully'}
+        if batch:
+            response['images'] = images
+        else:
+            response['image'] = images[0]
+        return jsonify(response)
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+def _profiles_authorized():
+    """Captures are only served to requests signed with PROFILE_SECRET; without a secret, never."""
+    return profiler.verify(request.headers.get(PROFILE_HEADER))
+
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """Lists the stored profiling captures, newest first."""
+    if not _profiles_authorized():
+        return jsonify({'error': 'A signed X-Profile header is required (set PROFILE_SECRET)'}), 403
+    return jsonify({'profiles': profiler.list_profiles()})
+
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Downloads one capture in pstats format."""
+    if not _profiles_authorized():
+        return jsonify({'error': 'A signed X-Profile header is required (set PROFILE_SECRET)'}), 403
+    path = profiler.profile_path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f'{profile_id}.pstats')
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -294,5 +1041,7 @@ if __name__ == '__main__':
     print("📡 Server running on http://localhost:5000")
     print("🔐 Endpoints:")
     print("   POST /api/process - Encrypt/Decrypt images")
+    print("   POST /api/rekey   - Re-encrypt images under a new key")
+    print("   GET  /api/profiles - Profiling captures")
     print("   GET  /api/health  - Health check")
     app.run(debug=True, host='0.0.0.0', port=5000)
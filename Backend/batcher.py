@@ -0,0 +1,115 @@
+"""
+Dynamic micro-batching of concurrent small-image requests.
+
+Requests are queued for at most max_wait_ms; the background worker then groups
+the ones that can share a vectorized pass (same handler, i.e. operation and
+cipher suite, image shape and key length), runs each group through the batched
+pipeline and hands every request its own result.
+
+Thumbnails (up to small_pixels) and larger images are queued separately, each
+with its own worker, so a pass over large images never delays a thumbnail. A
+group is further split into passes of at most max_batch_pixels pixels, which
+bounds the time any pass keeps its worker busy.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class RequestBatcher:
+    def __init__(self, handlers, max_batch_size=16, max_wait_ms=5.0, max_pixels=256 * 256,
+                 small_pixels=64 * 64, max_batch_pixels=4 * 256 * 256):
+        """
+        Args:
+            handlers: dict mapping a handler name to a batch function taking
+                (B x N x M array, list of B keys) and returning B x N x M results
+            max_batch_size: most requests processed in one pass (<= 1 disables batching)
+            max_wait_ms: longest time the first request of a batch waits for others
+            max_pixels: larger images are not batched
+            small_pixels: images up to this size use the thumbnail queue
+            max_batch_pixels: most pixels (images x pixels per image) in one pass
+        """
+        self.handlers = handlers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_pixels = max_pixels
+        self.small_pixels = small_pixels
+        self.max_batch_pixels = max_batch_pixels
+        self.batches = 0
+        self.requests = 0
+        self._queues = {'small': queue.Queue(), 'large': queue.Queue()}
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_batch_size > 1
+
+    def accepts(self, handler, image_array):
+        """True if the request should go through the batcher."""
+        return (self.enabled and handler in self.handlers
+                and image_array.ndim == 2 and image_array.size <= self.max_pixels)
+
+    def submit(self, handler, image_array, key):
+        """
+        Queues one request.
+
+        Returns:
+            Future resolving to the processed N x M array
+        """
+        lane = 'small' if image_array.size <= self.small_pixels else 'large'
+        self._start(lane)
+        future = Future()
+        self._queues[lane].put((handler, image_array, key, future))
+        return future
+
+    def _start(self, lane):
+        # Started lazily so the threads live in the serving process
+        with self._lock:
+            worker = self._workers.get(lane)
+            if worker is None or not worker.is_alive():
+                worker = threading.Thread(target=self._run, args=(self._queues[lane],),
+                                          name=f'request-batcher-{lane}', daemon=True)
+                self._workers[lane] = worker
+                worker.start()
+
+    def _collect(self, requests):
+        """Blocks for the first request, then gathers more until full or max_wait elapsed."""
+        pending = [requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self, requests):
+        while True:
+            groups = {}
+            for item in self._collect(requests):
+                handler, image_array, key, future = item
+                groups.setdefault((handler, image_array.shape, len(key)), []).append(item)
+
+            for (handler, shape, _), items in groups.items():
+                per_pass = max(1, self.max_batch_pixels // (shape[0] * shape[1]))
+                for start in range(0, len(items), per_pass):
+                    self._process(handler, items[start:start + per_pass])
+
+    def _process(self, handler, items):
+        try:
+            results = self.handlers[handler]([item[1] for item in items], [item[2] for item in items])
+        except Exception as e:
+            for item in items:
+                item[3].set_exception(e)
+            return
+
+        self.batches += 1
+        self.requests += len(items)
+        for item, result in zip(items, results):
+            item[3].set_result(result)
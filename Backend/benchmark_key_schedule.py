@@ -0,0 +1,74 @@
+"""
+Benchmark of encryption latency against key length for each key schedule.
+
+With the legacy 'length' schedule the DNN has len(key) neurons, so latency grows
+with the key; with 'kdf' it stays flat.
+
+Usage:
+    python benchmark_key_schedule.py --size 128 --lengths 8,16,64,256,1024 --repeats 3
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from app import encrypt_image
+from key_schedule import KEY_SCHEDULES
+
+
+def benchmark(size=64, lengths=(8, 16, 64, 256, 1024), repeats=3, cipher_suite=None,
+              key_schedules=KEY_SCHEDULES):
+    """
+    Returns:
+        dict key_schedule -> list of {'key_length', 'median_ms', 'min_ms'}
+    """
+    image = np.random.default_rng(0).integers(0, 256, (size, size), dtype=np.uint8)
+    results = {}
+    for key_schedule in key_schedules:
+        results[key_schedule] = []
+        for length in lengths:
+            key = ('BenchmarkKey' * (length // 12 + 1))[:length]
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                encrypt_image(image, key, cipher_suite=cipher_suite, key_schedule=key_schedule)
+                timings.append((time.perf_counter() - start) * 1000)
+            results[key_schedule].append({
+                'key_length': length,
+                'median_ms': float(np.median(timings)),
+                'min_ms': float(np.min(timings)),
+            })
+    return results
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Encryption latency against key length')
+    parser.add_argument('--size', type=int, default=64, help='square image size')
+    parser.add_argument('--lengths', type=_int_list, default=[8, 16, 64, 256, 1024])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--cipher-suite', help='cipher suite, e.g. v1 or v2')
+    parser.add_argument('--json', dest='json_path', help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.size, args.lengths, args.repeats, args.cipher_suite)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    print(f"Encryption of a {args.size}x{args.size} image, median of {args.repeats} run(s), ms")
+    print(f"{'key length':>10} " + " ".join(f"{key_schedule:>10}" for key_schedule in results))
+    for index, length in enumerate(args.lengths):
+        print(f"{length:>10} " + " ".join(f"{rows[index]['median_ms']:>10.1f}" for rows in results.values()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+Cipher quality analysis for encrypted images.
+
+Computes Shannon entropy, histogram uniformity, adjacent pixel correlation
+(horizontal / vertical / diagonal), NPCR and UACI for a one-pixel and a
+one-key-bit change, and key sensitivity of decryption. All metrics are
+vectorized NumPy; .npy ciphertexts are memory-mapped and files are analysed
+in parallel worker processes.
+
+Usage:
+    python cipher_analysis.py images/*.png --key MySecretKey --json report.json --csv report.csv
+    python cipher_analysis.py encrypted/*.npy --ciphertext --json report.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from app import encrypt_image, decrypt_image
+
+
+def load_image(path):
+    """
+    Loads a grayscale image. .npy files are memory-mapped instead of read.
+    """
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    with Image.open(path) as image:
+        return np.asarray(image.convert('L'))
+
+
+def shannon_entropy(image):
+    """Shannon entropy in bits per pixel (8.0 is ideal)."""
+    counts = np.bincount(np.asarray(image, dtype=np.uint8).ravel(), minlength=256)
+    p = counts[counts > 0] / counts.sum()
+    return float(-np.sum(p * np.log2(p)))
+
+
+def histogram_chi_square(image):
+    """Chi-square statistic of the histogram against a uniform distribution (255 dof)."""
+    counts = np.bincount(np.asarray(image, dtype=np.uint8).ravel(), minlength=256)
+    expected = counts.sum() / 256
+    return float(np.sum((counts - expected) ** 2) / expected)
+
+
+def _correlation(a, b):
+    a = a.ravel().astype(np.float64)
+    b = b.ravel().astype(np.float64)
+    a -= a.mean()
+    b -= b.mean()
+    denominator = np.sqrt(np.dot(a, a) * np.dot(b, b))
+    if denominator == 0:
+        return 0.0
+    return float(np.dot(a, b) / denominator)
+
+
+def adjacent_correlation(image):
+    """Correlation coefficients of horizontally, vertically and diagonally adjacent pixels."""
+    image = np.asarray(image)
+    return {
+        'horizontal': _correlation(image[:, :-1], image[:, 1:]),
+        'vertical': _correlation(image[:-1, :], image[1:, :]),
+        'diagonal': _correlation(image[:-1, :-1], image[1:, 1:]),
+    }
+
+
+def npcr_uaci(c1, c2):
+    """
+    Number of Pixels Change Rate and Unified Average Changing Intensity, in percent.
+
+    Returns:
+        [npcr, uaci]
+    """
+    c1 = np.asarray(c1, dtype=np.int16)
+    c2 = np.asarray(c2, dtype=np.int16)
+    npcr = np.count_nonzero(c1 != c2) / c1.size * 100
+    uaci = np.abs(c1 - c2).mean() / 255 * 100
+    return [float(npcr), float(uaci)]
+
+
+def change_one_pixel(image):
+    """Returns a copy of the image with the centre pixel incremented (mod 256)."""
+    changed = np.array(image, dtype=np.uint8)
+    row, col = changed.shape[0] // 2, changed.shape[1] // 2
+    changed[row, col] = (int(changed[row, col]) + 1) % 256
+    return changed
+
+
+def flip_key_bit(key):
+    """Returns the key with the lowest bit of its last character flipped."""
+    return key[:-1] + chr(ord(key[-1]) ^ 1)
+
+
+def statistical_metrics(ciphertext, timings):
+    """Metrics that only need the ciphertext."""
+    start = time.perf_counter()
+    result = {
+        'entropy': shannon_entropy(ciphertext),
+        'chi_square': histogram_chi_square(ciphertext),
+    }
+    timings['histogram'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for direction, value in adjacent_correlation(ciphertext).items():
+        result[f'correlation_{direction}'] = value
+    timings['correlation'] = time.perf_counter() - start
+    return result
+
+
+def analyse_file(path, key=None, ciphertext_only=False, cipher_suite=None):
+    """
+    Analyses one image file.
+
+    Args:
+        path: image or .npy file
+        key: encryption key, required unless ciphertext_only
+        ciphertext_only: the file is already encrypted, skip the differential metrics
+        cipher_suite: suite to encrypt with (default: the app's DEFAULT_CIPHER_SUITE)
+
+    Returns:
+        dict with the metrics and per-stage timings in seconds
+    """
+    timings = {}
+    total_start = time.perf_counter()
+
+    start = time.perf_counter()
+    image = load_image(path)
+    timings['load'] = time.perf_counter() - start
+
+    result = {'path': path, 'height': int(image.shape[0]), 'width': int(image.shape[1])}
+
+    if ciphertext_only:
+        result.update(statistical_metrics(image, timings))
+    else:
+        # The metadata records the cipher suite and key schedule decryption must use
+        start = time.perf_counter()
+        metadata = {}
+        ciphertext = encrypt_image(np.asarray(image, dtype=np.uint8), key, metadata=metadata,
+                                   cipher_suite=cipher_suite)
+        timings['encrypt'] = time.perf_counter() - start
+
+        result.update(statistical_metrics(ciphertext, timings))
+
+        start = time.perf_counter()
+        result['plain_entropy'] = shannon_entropy(image)
+        for direction, value in adjacent_correlation(image).items():
+            result[f'plain_correlation_{direction}'] = value
+        timings['plain_metrics'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        changed = encrypt_image(change_one_pixel(image), key, cipher_suite=cipher_suite)
+        [result['npcr_pixel'], result['uaci_pixel']] = npcr_uaci(ciphertext, changed)
+        timings['pixel_sensitivity'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        wrong_key = flip_key_bit(key)
+        changed = encrypt_image(np.asarray(image, dtype=np.uint8), wrong_key, cipher_suite=cipher_suite)
+        [result['npcr_key'], result['uaci_key']] = npcr_uaci(ciphertext, changed)
+        timings['key_sensitivity'] = time.perf_counter() - start
+
+        # Decrypting with a key one bit off must not reveal the plain image
+        start = time.perf_counter()
+        recovered = decrypt_image(ciphertext, wrong_key, metadata=metadata, workers=1)
+        [result['npcr_wrong_key_decrypt'], result['uaci_wrong_key_decrypt']] = npcr_uaci(image, recovered)
+        timings['wrong_key_decrypt'] = time.perf_counter() - start
+
+    timings['total'] = time.perf_counter() - total_start
+    result['timings'] = timings
+    return result
+
+
+def _analyse_file_safe(path, key, ciphertext_only, cipher_suite):
+    try:
+        return analyse_file(path, key, ciphertext_only, cipher_suite)
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+
+
+def analyse_corpus(paths, key=None, ciphertext_only=False, workers=None, cipher_suite=None):
+    """
+    Analyses many files in parallel worker processes.
+
+    Returns:
+        report dict with the per-image results and the mean of every metric
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers <= 1:
+        images = [_analyse_file_safe(path, key, ciphertext_only, cipher_suite) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            images = list(executor.map(_analyse_file_safe, paths,
+                                       [key] * len(paths), [ciphertext_only] * len(paths),
+                                       [cipher_suite] * len(paths)))
+
+    summary = {}
+    analysed = [image for image in images if 'error' not in image]
+    metric_names = [name for name in (analysed[0] if analysed else {})
+                    if name not in ('path', 'height', 'width', 'timings')]
+    for name in metric_names:
+        summary[name] = float(np.mean([image[name] for image in analysed]))
+
+    return {
+        'images': images,
+        'summary': summary,
+        'analysed': len(analysed),
+        'failed': len(images) - len(analysed),
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def write_csv(report, path):
+    """Writes one row per image, timings flattened into timing_<stage> columns."""
+    rows = []
+    for image in report['images']:
+        row = {name: value for name, value in image.items() if name != 'timings'}
+        for stage, seconds in image.get('timings', {}).items():
+            row[f'timing_{stage}'] = seconds
+        rows.append(row)
+
+    fieldnames = []
+    for row in rows:
+        fieldnames.extend(name for name in row if name not in fieldnames)
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cipher quality analysis for encrypted images')
+    parser.add_argument('paths', nargs='+', help='plain images, or ciphertexts with --ciphertext')
+    parser.add_argument('--key', help='encryption key (required unless --ciphertext)')
+    parser.add_argument('--ciphertext', action='store_true',
+                        help='inputs are already encrypted; only compute the statistical metrics')
+    parser.add_argument('--cipher-suite', help='cipher suite to encrypt with, e.g. v1 or v2')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--json', dest='json_path', help='write the full report as JSON')
+    parser.add_argument('--csv', dest='csv_path', help='write one row per image as CSV')
+    args = parser.parse_args(argv)
+
+    if not args.ciphertext and (args.key is None or len(args.key) < 8):
+        parser.error('--key of at least 8 characters is required unless --ciphertext is given')
+
+    report = analyse_corpus(args.paths, args.key, args.ciphertext, args.workers, args.cipher_suite)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.csv_path:
+        write_csv(report, args.csv_path)
+
+    print(f"Analysed {report['analysed']} image(s) in {report['elapsed']:.2f}s, {report['failed']} failed")
+    for name, value in report['summary'].items():
+        print(f"  {name:28s} {value:.6f}")
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
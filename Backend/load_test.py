@@ -0,0 +1,316 @@
+"""
+Load-testing harness for the Flask API.
+
+Starts the app locally, either in-process through Flask's test client or on a
+loopback HTTP port, and drives /api/process and /api/process_base64 with a
+configurable mix of image sizes, concurrency levels and encrypt/decrypt ratio.
+Reports RPS, p50/p95/p99 latency, error rate and server RSS over time, and
+checks every response: encryption must return the reference ciphertext and
+decryption the original image, so decrypt(encrypt(x)) round-trips.
+
+Usage:
+    python load_test.py --mode client --sizes 64,128 --concurrency 1,4,16 --requests 64
+    python load_test.py --mode http --decrypt-ratio 0.5 --json load_report.json
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from app import app
+
+
+ENDPOINTS = ['process', 'process_base64']
+
+
+def current_rss_mb():
+    """Resident set size of this process (which hosts the server) in MB."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        # Not Linux: fall back to the peak RSS (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class RssSampler:
+    """Samples the RSS in a background thread."""
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._start = time.perf_counter()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append([round(time.perf_counter() - self._start, 3), round(current_rss_mb(), 2)])
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.samples.append([round(time.perf_counter() - self._start, 3), round(current_rss_mb(), 2)])
+
+
+def png_bytes(image_array):
+    buffered = io.BytesIO()
+    Image.fromarray(image_array).save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def decode_response_image(data_url):
+    """Returns (array, raw PNG bytes) from the data URL of an API response."""
+    raw = base64.b64decode(data_url.split(',', 1)[1])
+    with Image.open(io.BytesIO(raw)) as image:
+        return np.array(image.convert('L')), raw
+
+
+def request_fields(key, operation, cipher_suite):
+    fields = {'key': key, 'operation': operation}
+    if cipher_suite:
+        fields['cipher_suite'] = cipher_suite
+    return fields
+
+
+class ClientTransport:
+    """Calls the app in-process through Flask's test client (one client per thread)."""
+    def __init__(self, cipher_suite=None):
+        self.cipher_suite = cipher_suite
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = app.test_client()
+        return self._local.client
+
+    def post(self, endpoint, image_png, key, operation):
+        if endpoint == 'process':
+            response = self._client().post('/api/process', data={
+                'image': (io.BytesIO(image_png), 'image.png'), **request_fields(key, operation, self.cipher_suite),
+            }, content_type='multipart/form-data')
+        else:
+            response = self._client().post('/api/process_base64', json={
+                'image': base64.b64encode(image_png).decode('utf-8'),
+                **request_fields(key, operation, self.cipher_suite),
+            })
+        return response.status_code, response.get_json()
+
+    def close(self):
+        pass
+
+
+class HttpTransport:
+    """Serves the app on a loopback port and calls it over HTTP."""
+    def __init__(self, cipher_suite=None):
+        self.cipher_suite = cipher_suite
+        import requests
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self._requests = requests
+        self._server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self.base_url = f'http://127.0.0.1:{self._server.server_port}'
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = self._requests.Session()
+        return self._local.session
+
+    def post(self, endpoint, image_png, key, operation):
+        if endpoint == 'process':
+            response = self._session().post(f'{self.base_url}/api/process', files={
+                'image': ('image.png', image_png, 'image/png'),
+            }, data=request_fields(key, operation, self.cipher_suite))
+        else:
+            response = self._session().post(f'{self.base_url}/api/process_base64', json={
+                'image': base64.b64encode(image_png).decode('utf-8'),
+                **request_fields(key, operation, self.cipher_suite),
+            })
+        return response.status_code, response.json()
+
+    def close(self):
+        self._server.shutdown()
+        self._thread.join()
+
+
+def prepare_corpus(transport, sizes, key, seed=0):
+    """
+    Encrypts one random image per size through the API and checks that it
+    decrypts back. The results are the references every load request is checked against.
+
+    Returns:
+        dict size -> {'plain', 'plain_png', 'cipher', 'cipher_png'}
+    """
+    rng = np.random.default_rng(seed)
+    corpus = {}
+    for size in sizes:
+        plain = rng.integers(0, 256, (size, size), dtype=np.uint8)
+        plain_png = png_bytes(plain)
+
+        status, body = transport.post('process_base64', plain_png, key, 'encrypt')
+        if status != 200:
+            raise RuntimeError(f'Encrypting the {size}x{size} reference image failed: {body}')
+        cipher, cipher_png = decode_response_image(body['image'])
+
+        status, body = transport.post('process_base64', cipher_png, key, 'decrypt')
+        if status != 200:
+            raise RuntimeError(f'Decrypting the {size}x{size} reference image failed: {body}')
+        decrypted, _ = decode_response_image(body['image'])
+        if not np.array_equal(decrypted, plain):
+            raise RuntimeError(f'decrypt(encrypt(x)) does not round-trip for {size}x{size}')
+
+        corpus[size] = {'plain': plain, 'plain_png': plain_png, 'cipher': cipher, 'cipher_png': cipher_png}
+    return corpus
+
+
+def run_request(transport, corpus, key, size, endpoint, operation):
+    """
+    Sends one request and checks its result.
+
+    Returns:
+        [latency in seconds, outcome] where outcome is 'ok', 'error' or 'mismatch'
+    """
+    reference = corpus[size]
+    image_png = reference['plain_png'] if operation == 'encrypt' else reference['cipher_png']
+    expected = reference['cipher'] if operation == 'encrypt' else reference['plain']
+
+    start = time.perf_counter()
+    try:
+        status, body = transport.post(endpoint, image_png, key, operation)
+    except Exception:
+        return [time.perf_counter() - start, 'error']
+    latency = time.perf_counter() - start
+
+    if status != 200 or not body or not body.get('success'):
+        return [latency, 'error']
+    result, _ = decode_response_image(body['image'])
+    return [latency, 'ok' if np.array_equal(result, expected) else 'mismatch']
+
+
+def run_level(transport, corpus, key, concurrency, num_requests, sizes, endpoints, decrypt_ratio, seed):
+    """Runs num_requests requests with the given concurrency and summarizes them."""
+    rng = random.Random(seed)
+    plan = [(rng.choice(sizes), rng.choice(endpoints),
+             'decrypt' if rng.random() < decrypt_ratio else 'encrypt') for _ in range(num_requests)]
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda job: run_request(transport, corpus, key, *job), plan))
+        elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    outcomes = [outcome for _, outcome in results]
+    return {
+        'concurrency': concurrency,
+        'requests': num_requests,
+        'elapsed_s': elapsed,
+        'rps': num_requests / elapsed,
+        'errors': outcomes.count('error'),
+        'mismatches': outcomes.count('mismatch'),
+        'error_rate': (num_requests - outcomes.count('ok')) / num_requests,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'max': float(latencies.max()),
+        },
+        'rss_mb': rss.samples,
+    }
+
+
+def run_load_test(mode='client', sizes=(64, 128), concurrency=(1, 4, 16), num_requests=64,
+                  endpoints=ENDPOINTS, decrypt_ratio=0.5, key='LoadTestKey123', seed=0, cipher_suite=None):
+    """
+    Runs every concurrency level in turn.
+
+    Returns:
+        report dict with one entry per level
+    """
+    transport = ClientTransport(cipher_suite) if mode == 'client' else HttpTransport(cipher_suite)
+    try:
+        corpus = prepare_corpus(transport, sizes, key, seed)
+        levels = [run_level(transport, corpus, key, level, num_requests, list(sizes), list(endpoints),
+                            decrypt_ratio, seed + index)
+                  for index, level in enumerate(concurrency)]
+    finally:
+        transport.close()
+    return {
+        'mode': mode,
+        'sizes': list(sizes),
+        'endpoints': list(endpoints),
+        'decrypt_ratio': decrypt_ratio,
+        'cipher_suite': cipher_suite,
+        'levels': levels,
+    }
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test for the Image Encryption API')
+    parser.add_argument('--mode', choices=['client', 'http'], default='client',
+                        help="'client': Flask test client in-process, 'http': loopback HTTP server")
+    parser.add_argument('--sizes', type=_int_list, default=[64, 128], help='square image sizes, e.g. 64,128,256')
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 4, 16], help='concurrency levels, e.g. 1,4,16')
+    parser.add_argument('--requests', type=int, default=64, help='requests per concurrency level')
+    parser.add_argument('--endpoint', choices=ENDPOINTS + ['both'], default='both')
+    parser.add_argument('--decrypt-ratio', type=float, default=0.5, help='share of decrypt requests (0..1)')
+    parser.add_argument('--key', default='LoadTestKey123')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cipher-suite', help='cipher suite to encrypt with, e.g. v1 or v2')
+    parser.add_argument('--json', dest='json_path', help='write the full report as JSON')
+    args = parser.parse_args(argv)
+
+    endpoints = ENDPOINTS if args.endpoint == 'both' else [args.endpoint]
+    report = run_load_test(args.mode, args.sizes, args.concurrency, args.requests, endpoints,
+                           args.decrypt_ratio, args.key, args.seed, args.cipher_suite)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"Mode: {report['mode']}  sizes: {report['sizes']}  decrypt ratio: {report['decrypt_ratio']}")
+    print(f"{'conc':>5} {'reqs':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'err %':>6} {'rss MB':>8}")
+    failed = False
+    for level in report['levels']:
+        latency = level['latency_ms']
+        peak_rss = max(rss for _, rss in level['rss_mb'])
+        print(f"{level['concurrency']:>5} {level['requests']:>5} {level['rps']:>8.2f} "
+              f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} "
+              f"{level['error_rate'] * 100:>6.2f} {peak_rss:>8.1f}")
+        if level['mismatches']:
+            print(f"  ❌ {level['mismatches']} response(s) did not match the reference image")
+        failed = failed or level['error_rate'] > 0
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
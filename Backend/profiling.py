@@ -0,0 +1,154 @@
+"""
+On-demand per-request profiling.
+
+A request is profiled when it carries a valid signed X-Profile header or is
+picked by the sampling rate. Its encryption / decryption then runs under
+cProfile and the stats are dumped in pstats format (readable with pstats,
+snakeviz or flameprof) into a directory that keeps at most max_profiles
+captures. When the sampling rate is 0 and no secret is configured, nothing
+is checked or wrapped.
+
+Only one capture runs at a time. From Python 3.12 cProfile is built on
+sys.monitoring, which allows a single active profiler per process (and a
+capture then also sees other threads); a request selected while another
+capture is running is processed without profiling.
+"""
+
+import cProfile
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+
+PROFILE_HEADER = 'X-Profile'
+# Signed header values are only accepted this long after their timestamp
+SIGNATURE_MAX_AGE = 300
+
+_PROFILE_ID = re.compile(r'^[0-9A-Za-z_-]+$')
+
+
+def sign_profile_request(secret, timestamp=None):
+    """
+    Builds a value for the X-Profile header: "<unix time>:<HMAC-SHA256 of it>".
+    """
+    timestamp = str(int(time.time() if timestamp is None else timestamp))
+    signature = hmac.new(secret.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+    return f'{timestamp}:{signature}'
+
+
+class RequestProfiler:
+    def __init__(self, directory, max_profiles=50, sample_rate=0.0, secret=None):
+        """
+        Args:
+            directory: where captures are stored
+            max_profiles: older captures are deleted beyond this number
+            sample_rate: share of requests profiled without a header (0..1)
+            secret: key for signed X-Profile headers; None disables them
+        """
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.sample_rate = sample_rate
+        self.secret = secret
+        self._lock = threading.Lock()
+        self._capture_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or bool(self.secret)
+
+    def verify(self, header_value):
+        """True if header_value is a fresh signature made with the secret."""
+        if not self.secret or not header_value or ':' not in header_value:
+            return False
+        timestamp, _ = header_value.split(':', 1)
+        try:
+            age = time.time() - int(timestamp)
+        except ValueError:
+            return False
+        if abs(age) > SIGNATURE_MAX_AGE:
+            return False
+        return hmac.compare_digest(header_value, sign_profile_request(self.secret, timestamp))
+
+    def should_profile(self, header_value=None):
+        """Decides whether the current request is profiled."""
+        if not self.enabled:
+            return False
+        if header_value is not None and self.verify(header_value):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def run(self, info, function, *args, **kwargs):
+        """
+        Calls function under cProfile and stores the capture. If another capture
+        is in progress the function is called without profiling.
+
+        Args:
+            info: dict describing the request, stored next to the stats
+
+        Returns:
+            the function's result
+        """
+        if not self._capture_lock.acquire(blocking=False):
+            return function(*args, **kwargs)
+        try:
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            try:
+                return profiler.runcall(function, *args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                self._save(profiler, dict(info, duration_ms=duration * 1000))
+        finally:
+            self._capture_lock.release()
+
+    def _save(self, profiler, info):
+        os.makedirs(self.directory, exist_ok=True)
+        created = time.time()
+        profile_id = f'{int(created * 1000)}-{uuid.uuid4().hex[:8]}'
+        profiler.dump_stats(os.path.join(self.directory, f'{profile_id}.pstats'))
+        with open(os.path.join(self.directory, f'{profile_id}.json'), 'w') as f:
+            json.dump(dict(info, id=profile_id, created=created), f)
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            profile_ids = self._profile_ids()
+            for profile_id in profile_ids[:-self.max_profiles] if self.max_profiles > 0 else profile_ids:
+                for extension in ('.pstats', '.json'):
+                    try:
+                        os.remove(os.path.join(self.directory, profile_id + extension))
+                    except FileNotFoundError:
+                        pass
+
+    def _profile_ids(self):
+        """Ids of the stored captures, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len('.pstats')] for name in os.listdir(self.directory)
+                      if name.endswith('.pstats'))
+
+    def list_profiles(self):
+        """Descriptions of the stored captures, newest first."""
+        profiles = []
+        for profile_id in reversed(self._profile_ids()):
+            try:
+                with open(os.path.join(self.directory, f'{profile_id}.json')) as f:
+                    info = json.load(f)
+                info['size'] = os.path.getsize(os.path.join(self.directory, f'{profile_id}.pstats'))
+            except (OSError, ValueError):
+                continue
+            profiles.append(info)
+        return profiles
+
+    def profile_path(self, profile_id):
+        """Path of a capture's pstats file, or None if there is no such capture."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, f'{profile_id}.pstats')
+        return path if os.path.isfile(path) else None
@@ -27,11 +27,41 @@ def test_health_check():
 
 
 def test_image_encryption():
-    """Test the image encryption endpoint"""
+    """Test that an image encrypted by the API decrypts back to the original"""
     print("\n🔍 Testing image encryption endpoint...")
-    print("Note: You need to have a test image to run this test.")
-    print("Skipping automated encryption test. Use the frontend to test image processing.")
-    return True
+    try:
+        import base64
+        import io
+        import numpy as np
+        from PIL import Image
+
+        image = np.random.default_rng(0).integers(0, 256, (32, 32), dtype=np.uint8)
+        buffered = io.BytesIO()
+        Image.fromarray(image).save(buffered, format="PNG")
+        payload = base64.b64encode(buffered.getvalue()).decode('utf-8')
+
+        results = {}
+        for operation in ['encrypt', 'decrypt']:
+            response = requests.post('http://localhost:5000/api/process_base64', json={
+                'image': payload, 'key': 'TestKey12345', 'operation': operation,
+            })
+            if response.status_code != 200:
+                print(f"❌ {operation} failed with status code: {response.status_code}")
+                return False
+            payload = response.json()['image'].split(',', 1)[1]
+            results[operation] = np.array(Image.open(io.BytesIO(base64.b64decode(payload))))
+
+        if np.array_equal(results['decrypt'], image):
+            print("✅ Encrypt/decrypt round trip passed")
+            return True
+        print("❌ Decrypted image does not match the original")
+        return False
+    except requests.exceptions.ConnectionError:
+        print("❌ Could not connect to server. Make sure the Flask server is running on http://localhost:5000")
+        return False
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
 
 
 if __name__ == '__main__':
@@ -46,12 +76,14 @@ if __name__ == '__main__':
         print("   2. Server is accessible on http://localhost:5000")
         sys.exit(1)
     
-    # Test image encryption (manual)
-    test_image_encryption()
+    # Test image encryption round trip
+    if not test_image_encryption():
+        sys.exit(1)
     
     print("\n" + "=" * 60)
     print("✅ Basic tests completed!")
     print("=" * 60)
+    print("\n📝 Load testing: python load_test.py --help")
     print("\n📝 Next steps:")
     print("   1. Open the frontend application")
     print("   2. Upload an image")
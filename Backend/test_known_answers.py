@@ -0,0 +1,56 @@
+"""
+Known-answer tests for the cipher suites. No server needed:
+python -m pytest test_known_answers.py
+
+The v1 / 'length' answer is the output of the original algorithm; a change to
+any of these digests breaks decryption of stored images.
+"""
+
+import hashlib
+
+import numpy as np
+
+import app
+
+PASSWORD = 'MySecretKey1'
+KNOWN_ANSWERS = {
+    ('v1', 'length'): '8d205aeaa5a0f744c909ac7f46a5db74cfb752839550ab0d483555fd06168a4f',
+    ('v1', 'kdf'): '11dc2ee9a4b71f3a30b6ee468783c440afd525911a44c7e6175d705255b59ec0',
+    ('v2', 'length'): 'c90bc93d5d2080cd9cd5a1ffc4266e5969077a865eafbd6a889b341fd036b3d7',
+    ('v2', 'kdf'): 'df351e8ffc43c0f56d23a49e518f8e916bc7d8fa096b83aa289c7aa041e016b6',
+}
+
+
+def _plain_image():
+    return (np.arange(16 * 12, dtype=np.uint16).reshape(16, 12) * 37 % 256).astype(np.uint8)
+
+
+def _digest(array):
+    return hashlib.sha256(np.ascontiguousarray(array, dtype=np.uint8).tobytes()).hexdigest()
+
+
+def test_known_answers():
+    """Every suite and key schedule produces its recorded ciphertext and decrypts it"""
+    image = _plain_image()
+    for (cipher_suite, key_schedule), expected in KNOWN_ANSWERS.items():
+        metadata = {}
+        encrypted = app.encrypt_image(image, PASSWORD, metadata=metadata, cipher_suite=cipher_suite,
+                                      key_schedule=key_schedule)
+        assert _digest(encrypted) == expected, (cipher_suite, key_schedule)
+        assert np.array_equal(app.decrypt_image(encrypted, PASSWORD, metadata), image)
+
+
+def test_known_answers_batched():
+    """The batched kernels produce the same ciphertexts"""
+    image = _plain_image()
+    for (cipher_suite, key_schedule), expected in KNOWN_ANSWERS.items():
+        suite = app.get_cipher_suite(cipher_suite)
+        key = app.derive_key(PASSWORD, key_schedule)
+        encrypted = suite.encrypt_batch([image, image], [key, key])
+        assert [_digest(array) for array in encrypted] == [expected, expected], (cipher_suite, key_schedule)
+
+
+if __name__ == '__main__':
+    test_known_answers()
+    test_known_answers_batched()
+    print('✅ All known answers match')
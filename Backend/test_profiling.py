@@ -0,0 +1,40 @@
+"""
+Tests for the on-demand profiling hook. No server needed:
+python -m pytest test_profiling.py
+"""
+
+import tempfile
+import threading
+import time
+
+from profiling import RequestProfiler, sign_profile_request
+
+
+def test_overlapping_captures():
+    """Requests profiled at the same time all complete; only one is captured at a time"""
+    with tempfile.TemporaryDirectory() as directory:
+        profiler = RequestProfiler(directory, max_profiles=10, sample_rate=1.0)
+        started = threading.Barrier(3)
+        results = [None] * 3
+
+        def request(index):
+            started.wait()
+            results[index] = profiler.run({'operation': 'test'}, lambda: time.sleep(0.2) or index)
+
+        threads = [threading.Thread(target=request, args=(index,)) for index in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [0, 1, 2]
+        assert len(profiler.list_profiles()) == 1
+
+
+def test_signed_header():
+    """Only fresh headers signed with the secret select a request"""
+    profiler = RequestProfiler(tempfile.gettempdir(), secret='s3cret')
+    assert profiler.should_profile(sign_profile_request('s3cret'))
+    assert not profiler.should_profile(sign_profile_request('other'))
+    assert not profiler.should_profile(sign_profile_request('s3cret', time.time() - 3600))
+    assert not RequestProfiler(tempfile.gettempdir()).should_profile(sign_profile_request('s3cret'))
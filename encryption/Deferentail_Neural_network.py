@@ -1,3 +1,9 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 import numpy as np
 
 class DifferentialNeuralNetwork:
@@ -38,6 +44,66 @@ class DifferentialNeuralNetwork:
         # --- Step 3: Initialize bias vector ---
         self.bias_vector = np.zeros(self.num_neurons, dtype=np.uint8)
 
+    def get_state(self):
+        """
+        Returns the row-to-row state of the network (input layer followed by the
+        bias vector) as bytes, so it can be stored as a checkpoint.
+        """
+        return (self.input_layer_state.astype(np.uint8).tobytes()
+                + self.bias_vector.astype(np.uint8).tobytes())
+
+    def set_state(self, state):
+        """
+        Restores a state previously returned by get_state().
+
+        Args:
+            state (bytes): 2 * num_neurons bytes (input layer, then bias vector).
+        """
+        if len(state) != 2 * self.num_neurons:
+            raise ValueError(f"DNN state must be {2 * self.num_neurons} bytes, got {len(state)}")
+        state = np.frombuffer(state, dtype=np.uint8)
+        self.input_layer_state = state[:self.num_neurons].copy()
+        self.bias_vector = state[self.num_neurons:].copy()
+
+    def _feedforward(self):
+        """
+        Lines 5-13 of Algorithm 5: runs the network once and returns the next
+        batch of blurring codes together with the first hidden layer output.
+        """
+        current_layer_values = self.input_layer_state.astype(np.float64)
+        first_hidden_layer_output = None
+
+        for i, layer_weights in enumerate(self.weights):
+            # Calculate weighted sum
+            z = np.dot(current_layer_values, layer_weights)
+
+            # Line 8: Add bias vector ONLY for the first hidden layer
+            if i == 0:
+                z += self.bias_vector
+                first_hidden_layer_output = z
+
+            current_layer_values = z
+
+        # The final output of the network becomes the next batch of blurring codes
+        current_codes = (current_layer_values.astype(np.uint64) % 256).astype(np.uint8)
+        return current_codes, first_hidden_layer_output
+
+    def _update_state(self, block_segment, current_codes, first_hidden_layer_output):
+        """
+        Lines 14-15 of Algorithm 5: updates the bias vector from the plain image
+        segment the codes were used for and feeds the first hidden layer back.
+        """
+        # The segment might be shorter than num_neurons if block_len isn't a multiple.
+        # Pad the segment to match the bias_vector length for the XOR operation.
+        if len(block_segment) < self.num_neurons:
+             padding = np.zeros(self.num_neurons - len(block_segment), dtype=np.uint8)
+             block_segment = np.concatenate((block_segment, padding))
+
+        diff = block_segment.astype(np.int16) - current_codes.astype(np.int16)
+        self.bias_vector = np.bitwise_xor(block_segment, diff.astype(np.uint8))
+
+        self.input_layer_state = (first_hidden_layer_output.astype(np.uint64) % 256).astype(np.uint8)
+
     def generate_codes_and_update(self, image_block):
         """
         Performs one full cycle: generates blurring codes for a block and updates the network's state.
@@ -57,23 +123,7 @@ class DifferentialNeuralNetwork:
         
         # Line 4 & 16: Repeat until desired blurring code length is reached
         while len(all_codes) < block_len:
-            # --- Lines 5-13: Feedforward Pass ---
-            current_layer_values = self.input_layer_state.astype(np.float64)
-            first_hidden_layer_output = None
-
-            for i, layer_weights in enumerate(self.weights):
-                # Calculate weighted sum
-                z = np.dot(current_layer_values, layer_weights)
-
-                # Line 8: Add bias vector ONLY for the first hidden layer
-                if i == 0:
-                    z += self.bias_vector
-                    first_hidden_layer_output = z
-                
-                current_layer_values = z
-
-            # The final output of the network becomes the next batch of blurring codes
-            current_codes = (current_layer_values.astype(np.uint64) % 256).astype(np.uint8)
+            current_codes, first_hidden_layer_output = self._feedforward()
             all_codes.extend(current_codes)
 
             # --- Line 14: Update the bias vector using a corresponding part of the image block ---
@@ -81,22 +131,307 @@ class DifferentialNeuralNetwork:
             start_idx = len(all_codes) - self.num_neurons
             end_idx = start_idx + self.num_neurons
             block_segment = image_block[start_idx:end_idx]
-            
-            # The segment might be shorter than num_neurons if block_len isn't a multiple.
-            # Pad the segment to match the bias_vector length for the XOR operation.
-            if len(block_segment) < self.num_neurons:
-                 padding = np.zeros(self.num_neurons - len(block_segment), dtype=np.uint8)
-                 block_segment = np.concatenate((block_segment, padding))
-
-            diff = block_segment.astype(np.int16) - current_codes.astype(np.int16)
-            self.bias_vector = np.bitwise_xor(block_segment, diff.astype(np.uint8))
-            
+
             # --- Line 15: Send output of first hidden layer as input feedback ---
-            self.input_layer_state = (first_hidden_layer_output.astype(np.uint64) % 256).astype(np.uint8)
+            self._update_state(block_segment, current_codes, first_hidden_layer_output)
         
         # Trim the generated codes to match the exact block length
         return np.array(all_codes[:block_len], dtype=np.uint8)
 
+    def recover_block_and_update(self, cipher_block):
+        """
+        Inverse of generate_codes_and_update followed by the XOR: recovers a row of
+        the V matrix from its encrypted row. The plain segment recovered for each
+        batch of codes is fed back into the state, exactly as during encryption.
+
+        Args:
+            cipher_block (np.array): A single row/block from the C matrix.
+
+        Returns:
+            np.array: The recovered row of the V matrix.
+        """
+        block_len = len(cipher_block)
+        recovered = np.empty(block_len, dtype=np.uint8)
+
+        for start_idx in range(0, block_len, self.num_neurons):
+            current_codes, first_hidden_layer_output = self._feedforward()
+            end_idx = min(start_idx + self.num_neurons, block_len)
+            block_segment = np.bitwise_xor(cipher_block[start_idx:end_idx].astype(np.uint8),
+                                           current_codes[:end_idx - start_idx])
+            recovered[start_idx:end_idx] = block_segment
+            self._update_state(block_segment, current_codes, first_hidden_layer_output)
+
+        return recovered
+
+
+MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def _mix32(z):
+    """Integer finalizer applied to every layer output of the integer network (uint64 lanes, 32-bit values)."""
+    z = ((z ^ (z >> np.uint64(16))) * np.uint64(0x45D9F3B)) & MASK32
+    return z ^ (z >> np.uint64(16))
+
+
+class IntegerDifferentialNeuralNetwork(DifferentialNeuralNetwork):
+    """
+    Integer-domain variant of the network used by the "v2" cipher suite. Weights
+    are 32-bit integers and every layer computes (x . W + bias) mod 2^32 followed
+    by _mix32, so results are exact, platform independent and vectorize without
+    floating point. State handling and the code/update cycle are inherited.
+    """
+    def _feedforward(self):
+        current_layer_values = self.input_layer_state.astype(np.uint64)
+        first_hidden_layer_output = None
+
+        for i, layer_weights in enumerate(self.weights):
+            # uint64 arithmetic wraps mod 2^64, so masking gives the sum mod 2^32
+            z = np.dot(current_layer_values, layer_weights) & MASK32
+
+            if i == 0:
+                z = (z + self.bias_vector.astype(np.uint64)) & MASK32
+
+            z = _mix32(z)
+            if i == 0:
+                first_hidden_layer_output = z
+
+            current_layer_values = z
+
+        current_codes = (current_layer_values >> np.uint64(24)).astype(np.uint8)
+        return current_codes, first_hidden_layer_output
+
+
+class BatchedDifferentialNeuralNetwork:
+    """
+    Runs B independent DifferentialNeuralNetworks with the same number of neurons
+    side by side, one lane per image, so a batch of images is processed with one
+    stacked matrix product per layer instead of B separate ones. Every lane
+    produces exactly the codes its own DifferentialNeuralNetwork would.
+    """
+    network_class = DifferentialNeuralNetwork
+
+    def __init__(self, keys, chaotic_weights_list, num_neurons=16, num_hidden_layers=3):
+        """
+        Args:
+            keys (list of str): The secret key of every lane.
+            chaotic_weights_list (list of np.array): The chaotic weights of every lane.
+            num_neurons (int): The number of neurons in each layer (shared by all lanes).
+            num_hidden_layers (int): The number of hidden layers.
+        """
+        self.num_neurons = num_neurons
+        self.num_layers = num_hidden_layers + 2
+        networks = [self.network_class(key, weights, num_neurons, num_hidden_layers)
+                    for key, weights in zip(keys, chaotic_weights_list)]
+
+        # One B x n x n stack per layer connection
+        self.weights = [np.stack([network.weights[layer] for network in networks])
+                        for layer in range(self.num_layers - 1)]
+        self.input_layer_state = np.stack([network.input_layer_state for network in networks])
+        self.bias_vector = np.stack([network.bias_vector for network in networks])
+
+    def _feedforward(self):
+        current_layer_values = self.input_layer_state.astype(np.float64)
+        first_hidden_layer_output = None
+
+        for i, layer_weights in enumerate(self.weights):
+            # B x 1 x n @ B x n x n: the same vector-matrix product as np.dot per lane
+            z = np.matmul(current_layer_values[:, None, :], layer_weights)[:, 0, :]
+
+            if i == 0:
+                z += self.bias_vector
+                first_hidden_layer_output = z
+
+            current_layer_values = z
+
+        current_codes = (current_layer_values.astype(np.uint64) % 256).astype(np.uint8)
+        return current_codes, first_hidden_layer_output
+
+    def _update_state(self, block_segments, current_codes, first_hidden_layer_output):
+        width = block_segments.shape[1]
+        if width < self.num_neurons:
+            padding = np.zeros((block_segments.shape[0], self.num_neurons - width), dtype=np.uint8)
+            block_segments = np.concatenate((block_segments, padding), axis=1)
+
+        diff = block_segments.astype(np.int16) - current_codes.astype(np.int16)
+        self.bias_vector = np.bitwise_xor(block_segments, diff.astype(np.uint8))
+
+        self.input_layer_state = (first_hidden_layer_output.astype(np.uint64) % 256).astype(np.uint8)
+
+    def generate_codes_and_update(self, image_blocks):
+        """
+        Batched generate_codes_and_update.
+
+        Args:
+            image_blocks (np.array): B x width, one row of the V matrix per lane.
+
+        Returns:
+            np.array: B x width blurring codes.
+        """
+        image_blocks = np.asarray(image_blocks).astype(np.uint8)
+        block_len = image_blocks.shape[1]
+        all_codes = np.empty(image_blocks.shape, dtype=np.uint8)
+
+        for start_idx in range(0, block_len, self.num_neurons):
+            current_codes, first_hidden_layer_output = self._feedforward()
+            end_idx = min(start_idx + self.num_neurons, block_len)
+            all_codes[:, start_idx:end_idx] = current_codes[:, :end_idx - start_idx]
+            self._update_state(image_blocks[:, start_idx:end_idx], current_codes, first_hidden_layer_output)
+
+        return all_codes
+
+    def recover_blocks_and_update(self, cipher_blocks):
+        """
+        Batched recover_block_and_update.
+
+        Args:
+            cipher_blocks (np.array): B x width, one row of the C matrix per lane.
+
+        Returns:
+            np.array: B x width recovered rows of the V matrices.
+        """
+        cipher_blocks = np.asarray(cipher_blocks).astype(np.uint8)
+        block_len = cipher_blocks.shape[1]
+        recovered = np.empty(cipher_blocks.shape, dtype=np.uint8)
+
+        for start_idx in range(0, block_len, self.num_neurons):
+            current_codes, first_hidden_layer_output = self._feedforward()
+            end_idx = min(start_idx + self.num_neurons, block_len)
+            block_segments = np.bitwise_xor(cipher_blocks[:, start_idx:end_idx],
+                                            current_codes[:, :end_idx - start_idx])
+            recovered[:, start_idx:end_idx] = block_segments
+            self._update_state(block_segments, current_codes, first_hidden_layer_output)
+
+        return recovered
+
+
+class BatchedIntegerDifferentialNeuralNetwork(BatchedDifferentialNeuralNetwork):
+    """Batched IntegerDifferentialNeuralNetwork, one lane per image."""
+    network_class = IntegerDifferentialNeuralNetwork
+
+    def _feedforward(self):
+        current_layer_values = self.input_layer_state.astype(np.uint64)
+        first_hidden_layer_output = None
+
+        for i, layer_weights in enumerate(self.weights):
+            z = np.matmul(current_layer_values[:, None, :], layer_weights)[:, 0, :] & MASK32
+
+            if i == 0:
+                z = (z + self.bias_vector.astype(np.uint64)) & MASK32
+
+            z = _mix32(z)
+            if i == 0:
+                first_hidden_layer_output = z
+
+            current_layer_values = z
+
+        current_codes = (current_layer_values >> np.uint64(24)).astype(np.uint8)
+        return current_codes, first_hidden_layer_output
+
+
+def decrypt_band(key, chaotic_weights, num_neurons, state, rows, network_class=None):
+    """
+    Decrypts a band of consecutive encrypted rows starting from a checkpointed
+    network state. Module-level so it can be shipped to worker processes.
+
+    Args:
+        key (str): The encryption secret key.
+        chaotic_weights (np.array): The same chaotic weights used for encryption.
+        num_neurons (int): The number of neurons in each layer.
+        state (bytes or None): State from get_state(), or None for the initial state.
+        rows (np.array): The encrypted rows of the band.
+        network_class: DifferentialNeuralNetwork (default) or a subclass.
+
+    Returns:
+        np.array: The recovered rows of the V matrix.
+    """
+    network_class = network_class or DifferentialNeuralNetwork
+    dnn = network_class(key, chaotic_weights, num_neurons=num_neurons)
+    if state is not None:
+        dnn.set_state(state)
+    return np.array([dnn.recover_block_and_update(c_i) for c_i in rows], dtype=np.uint8)
+
+
+_band_pool = None
+_band_pool_lock = threading.Lock()
+
+
+def _shared_band_pool(workers):
+    """
+    Process pool for band decryption, created on first use with `workers`
+    processes and shared by all later callers. Workers are started with forkserver (spawn where unavailable) so
+    they are never forked from a multi-threaded server process.
+    """
+    global _band_pool
+    with _band_pool_lock:
+        if _band_pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _band_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _band_pool
+
+
+def _discard_band_pool(pool):
+    """Drops a broken pool (e.g. a worker was killed) so the next call starts a new one."""
+    global _band_pool
+    with _band_pool_lock:
+        if _band_pool is pool:
+            _band_pool = None
+    pool.shutdown(wait=False)
+
+
+def decrypt_rows(key, chaotic_weights, num_neurons, encrypted_rows, interval, states, workers=None,
+                 network_class=None):
+    """
+    Recovers the V matrix from the C matrix. When checkpoints are available the
+    image is split into bands of `interval` rows that are decrypted independently,
+    in the shared worker pool if workers > 1 and there are at least as many
+    bands as workers (otherwise pool overhead outweighs the work). The result
+    is identical to decrypting all rows sequentially.
+
+    Args:
+        key (str): The encryption secret key.
+        chaotic_weights (np.array): The same chaotic weights used for encryption.
+        num_neurons (int): The number of neurons in each layer.
+        encrypted_rows (np.array): The C matrix.
+        interval (int): Rows per checkpoint, 0 if no checkpoints were recorded.
+        states (list of bytes): Network state before row k * interval, for k >= 1.
+        workers (int): Number of worker processes, defaults to the CPU count. The
+            shared pool is sized by the first call that starts it; later calls
+            only use this to decide between the pool and the calling thread.
+        network_class: DifferentialNeuralNetwork (default) or a subclass.
+
+    Returns:
+        np.array: The recovered V matrix.
+    """
+    if interval <= 0 or not states:
+        return decrypt_band(key, chaotic_weights, num_neurons, None, encrypted_rows, network_class)
+
+    if len(states) != (len(encrypted_rows) - 1) // interval:
+        raise ValueError("DNN checkpoints do not match the encrypted image height")
+
+    band_states = [None] + list(states)
+    bands = [encrypted_rows[k * interval:(k + 1) * interval] for k in range(len(band_states))]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(bands) < workers:
+        results = [decrypt_band(key, chaotic_weights, num_neurons, state, band, network_class)
+                   for state, band in zip(band_states, bands)]
+    else:
+        executor = _shared_band_pool(workers)
+        try:
+            futures = [executor.submit(decrypt_band, key, chaotic_weights, num_neurons, state, band,
+                                       network_class)
+                       for state, band in zip(band_states, bands)]
+            results = [future.result() for future in futures]
+        except BrokenProcessPool:
+            _discard_band_pool(executor)
+            results = [decrypt_band(key, chaotic_weights, num_neurons, state, band, network_class)
+                       for state, band in zip(band_states, bands)]
+
+    return np.concatenate(results).astype(np.uint8)
+
 # --- Example of how to use this class in your main script ---
 if __name__ == '__main__':
     # --- 1. Define your inputs (replace with your actual data) ---
@@ -0,0 +1,52 @@
+import json
+
+from PIL.PngImagePlugin import PngInfo
+
+
+# PNG text chunk holding the DNN state checkpoints of an encrypted image
+CHECKPOINTS_KEY = 'dnn_checkpoints'
+
+
+def encode_checkpoints(interval, states):
+    """
+    Serializes DNN checkpoints for storage in the ciphertext container.
+
+    Args:
+        interval (int): Number of rows between two checkpoints.
+        states (list of bytes): DNN state before row k * interval, for k >= 1.
+
+    Returns:
+        str: JSON text for the CHECKPOINTS_KEY chunk.
+    """
+    return json.dumps({'interval': interval, 'states': [state.hex() for state in states]})
+
+
+def decode_checkpoints(text):
+    """
+    Inverse of encode_checkpoints.
+
+    Returns:
+        [interval, states]
+    """
+    try:
+        data = json.loads(text)
+        interval = int(data['interval'])
+        states = [bytes.fromhex(state) for state in data['states']]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f'Invalid DNN checkpoints: {e}')
+    if interval <= 0:
+        raise ValueError('Invalid DNN checkpoints: interval must be positive')
+    return [interval, states]
+
+
+def create_png_info(metadata):
+    """Builds the PNG text chunks for the given container metadata."""
+    png_info = PngInfo()
+    for name, value in metadata.items():
+        png_info.add_text(name, value)
+    return png_info
+
+
+def read_png_metadata(image):
+    """Returns the container metadata (PNG text chunks) of an opened image."""
+    return dict(getattr(image, 'text', {}))
@@ -0,0 +1,51 @@
+# PNG text chunk holding the cipher suite an image was encrypted with.
+# Images without it predate versioning and are "v1".
+CIPHER_SUITE_KEY = 'cipher_suite'
+LEGACY_CIPHER_SUITE = 'v1'
+
+
+class CipherSuite:
+    """
+    One version of the encryption algorithm.
+
+    encrypt(image_array, password, checkpoint_interval, metadata) and
+    decrypt(encrypted_array, password, metadata, workers) process one image;
+    encrypt_batch / decrypt_batch(image_arrays, passwords) process several
+    images of the same shape and key length in one vectorized pass.
+    rekey(encrypted_array, old_password, new_password, checkpoint_interval,
+    metadata, new_metadata, workers), if given, re-encrypts a ciphertext of
+    this suite under a new password in one fused pass; otherwise re-keying
+    runs decrypt then encrypt. rekey_batch(encrypted_arrays, old_passwords,
+    new_passwords) does the same for several images in one vectorized pass.
+    """
+    def __init__(self, name, encrypt, decrypt, encrypt_batch, decrypt_batch, description='', rekey=None,
+                 rekey_batch=None):
+        self.name = name
+        self.encrypt = encrypt
+        self.decrypt = decrypt
+        self.encrypt_batch = encrypt_batch
+        self.decrypt_batch = decrypt_batch
+        self.description = description
+        self.rekey = rekey
+        self.rekey_batch = rekey_batch
+
+
+CIPHER_SUITES = {}
+
+
+def register_cipher_suite(suite):
+    CIPHER_SUITES[suite.name] = suite
+
+
+def get_cipher_suite(name):
+    """Returns the registered suite, raising ValueError for unknown names."""
+    if name not in CIPHER_SUITES:
+        raise ValueError(f'Unknown cipher suite "{name}". Available: {", ".join(sorted(CIPHER_SUITES))}')
+    return CIPHER_SUITES[name]
+
+
+def suite_from_metadata(metadata, default=LEGACY_CIPHER_SUITE):
+    """Name of the suite recorded in the container metadata, or default if untagged."""
+    if metadata and CIPHER_SUITE_KEY in metadata:
+        return metadata[CIPHER_SUITE_KEY]
+    return default
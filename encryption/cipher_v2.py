@@ -0,0 +1,363 @@
+"""
+Cipher suite "v2": the same substitute / perturb / substitute / DNN structure
+as v1, but in pure integer arithmetic with wrap-defined uint64 operations.
+
+- Key schedule: SHA-256 of the password split into four 64-bit seeds, expanded
+  with splitmix64 (no logistic map floats).
+- Substitution: forward and backward chained XOR per row, with a keyed state
+  per row; vectorized over all rows (and all images of a batch).
+- Perturbation: a keyed permutation of all pixels, computed with one argsort.
+- DNN: IntegerDifferentialNeuralNetwork, 32-bit integer weights.
+
+Results do not depend on platform floating point behaviour.
+"""
+
+import hashlib
+
+import numpy as np
+
+from Deferentail_Neural_network import (IntegerDifferentialNeuralNetwork,
+                                        BatchedIntegerDifferentialNeuralNetwork, decrypt_rows)
+from cipher_container import CHECKPOINTS_KEY, encode_checkpoints, decode_checkpoints
+
+
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+NUM_LAYERS = 5  # 1 input + 3 hidden + 1 output, as in v1
+
+
+def derive_seeds(password):
+    """
+    Four 64-bit seeds from the password: first substitution, perturbation,
+    second substitution and DNN weights.
+    """
+    digest = hashlib.sha256(password.encode()).digest()
+    return [np.uint64(int.from_bytes(digest[i:i + 8], 'little')) for i in range(0, 32, 8)]
+
+
+def splitmix64(values):
+    """splitmix64 finalizer on a uint64 array."""
+    z = values.astype(np.uint64)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def keystream(seed, count):
+    """count pseudo-random uint64 values derived from seed."""
+    counters = np.arange(1, count + 1, dtype=np.uint64)
+    return splitmix64(np.uint64(seed) + counters * GOLDEN_GAMMA)
+
+
+def _mix(state, value):
+    state = (state ^ value.astype(np.uint64)) * GOLDEN_GAMMA
+    return state ^ (state >> np.uint64(29))
+
+
+def _key_byte(state):
+    return (state >> np.uint64(56)).astype(np.int64)
+
+
+def _row_seeds(seed, num_rows):
+    """Forward and backward pass start states for every row."""
+    stream = keystream(seed, 2 * num_rows)
+    return [stream[0::2], stream[1::2]]
+
+
+def _substitute_rows(blocks, forward_states, backward_states):
+    """Forward then backward chained substitution, one lane per row of blocks."""
+    blocks = np.asarray(blocks, dtype=np.int64)
+    n = blocks.shape[1]
+    out1 = np.empty_like(blocks)
+    out = np.empty_like(blocks)
+
+    state = forward_states
+    for j in range(n):
+        out1[:, j] = blocks[:, j] ^ _key_byte(state)
+        state = _mix(state, blocks[:, j])
+
+    state = backward_states
+    for j in reversed(range(n)):
+        out[:, j] = out1[:, j] ^ _key_byte(state)
+        state = _mix(state, out1[:, j])
+
+    return out
+
+
+def _substitute_inv_rows(blocks, forward_states, backward_states):
+    """Inverse of _substitute_rows: backward pass first, then forward."""
+    blocks = np.asarray(blocks, dtype=np.int64)
+    n = blocks.shape[1]
+    out1 = np.empty_like(blocks)
+    out = np.empty_like(blocks)
+
+    state = backward_states
+    for j in reversed(range(n)):
+        out1[:, j] = blocks[:, j] ^ _key_byte(state)
+        state = _mix(state, out1[:, j])
+
+    state = forward_states
+    for j in range(n):
+        out[:, j] = out1[:, j] ^ _key_byte(state)
+        state = _mix(state, out[:, j])
+
+    return out
+
+
+def _resubstitute_rows(blocks, old_states, new_states):
+    """
+    _substitute_inv_rows with old_states followed by _substitute_rows with
+    new_states. The two passes that run left to right share one loop and one
+    buffer, so only one column of the intermediate rows exists at a time.
+    """
+    blocks = np.asarray(blocks, dtype=np.int64)
+    n = blocks.shape[1]
+    out1 = np.empty_like(blocks)
+    out = np.empty_like(blocks)
+    [old_forward, old_backward] = old_states
+    [new_forward, new_backward] = new_states
+
+    state = old_backward
+    for j in reversed(range(n)):
+        out1[:, j] = blocks[:, j] ^ _key_byte(state)
+        state = _mix(state, out1[:, j])
+
+    old_state, new_state = old_forward, new_forward
+    for j in range(n):
+        column = out1[:, j] ^ _key_byte(old_state)
+        old_state = _mix(old_state, column)
+        out1[:, j] = column ^ _key_byte(new_state)
+        new_state = _mix(new_state, column)
+
+    state = new_backward
+    for j in reversed(range(n)):
+        out[:, j] = out1[:, j] ^ _key_byte(state)
+        state = _mix(state, out1[:, j])
+
+    return out
+
+
+def substitute(blocks, seed):
+    """
+    Forward and backward substitution of every row of blocks (L x n), one lane
+    per row. Row i starts from the i-th states of the keystream of seed.
+    """
+    return _substitute_rows(blocks, *_row_seeds(seed, len(blocks)))
+
+
+def substitute_inv(blocks, seed):
+    """Inverse of substitute."""
+    return _substitute_inv_rows(blocks, *_row_seeds(seed, len(blocks)))
+
+
+def permutation(seed, size):
+    """Keyed permutation of range(size)."""
+    return np.argsort(keystream(seed, size), kind='stable')
+
+
+def perturb(image, seed):
+    """Scatters the pixels of an N x M image with the keyed permutation."""
+    flat = np.asarray(image).reshape(-1)
+    return flat[permutation(seed, flat.size)].reshape(np.shape(image))
+
+
+def perturb_inv(image, seed):
+    """Inverse of perturb."""
+    flat = np.asarray(image).reshape(-1)
+    restored = np.empty_like(flat)
+    restored[permutation(seed, flat.size)] = flat
+    return restored.reshape(np.shape(image))
+
+
+def dnn_weights(seed, num_neurons):
+    """32-bit integer weights for every layer connection."""
+    total_weights_needed = (NUM_LAYERS - 1) * (num_neurons * num_neurons)
+    return keystream(seed, total_weights_needed) >> np.uint64(32)
+
+
+def encrypt_image(image_array, password, checkpoint_interval=0, metadata=None):
+    """
+    Encrypts the image with cipher suite v2.
+
+    Args:
+        image_array: numpy array of the image
+        password: encryption key/password
+        checkpoint_interval: if > 0, record the DNN state every that many rows
+        metadata: optional dict, filled with the entries to store in the container
+
+    Returns:
+        encrypted_image: numpy array of encrypted image
+    """
+    [sub_seed, perm_seed, sec_sub_seed, dnn_seed] = derive_seeds(password)
+
+    T = substitute(image_array, sub_seed)
+    perturbed_image = perturb(T, perm_seed)
+    V = substitute(perturbed_image, sec_sub_seed).astype(np.uint8)
+
+    return _dnn_encrypt(V, password, dnn_seed, checkpoint_interval, metadata)
+
+
+def _dnn_encrypt(V, password, dnn_seed, checkpoint_interval=0, metadata=None):
+    """DNN stage of encrypt_image."""
+    num_neurons = len(password)
+    dnn = IntegerDifferentialNeuralNetwork(password, dnn_weights(dnn_seed, num_neurons), num_neurons=num_neurons)
+    C_matrix = np.empty(V.shape, dtype=np.uint8)
+    checkpoints = []
+    for row_index, v_i in enumerate(V):
+        if checkpoint_interval > 0 and row_index > 0 and row_index % checkpoint_interval == 0:
+            checkpoints.append(dnn.get_state())
+        C_matrix[row_index] = np.bitwise_xor(v_i, dnn.generate_codes_and_update(v_i))
+
+    if metadata is not None and checkpoint_interval > 0:
+        metadata[CHECKPOINTS_KEY] = encode_checkpoints(checkpoint_interval, checkpoints)
+
+    return C_matrix
+
+
+def decrypt_image(encrypted_array, password, metadata=None, workers=None):
+    """
+    Decrypts an image encrypted with cipher suite v2.
+
+    Args:
+        encrypted_array: numpy array of the encrypted image
+        password: decryption key/password
+        metadata: optional container metadata (DNN checkpoints)
+        workers: number of worker processes for the DNN stage
+
+    Returns:
+        decrypted_image: numpy array of decrypted image
+    """
+    [sub_seed, perm_seed, sec_sub_seed, dnn_seed] = derive_seeds(password)
+
+    V = _dnn_decrypt(encrypted_array, password, dnn_seed, metadata, workers)
+    perturbed_image = substitute_inv(V, sec_sub_seed)
+    T = perturb_inv(perturbed_image, perm_seed)
+    return substitute_inv(T, sub_seed).astype(np.uint8)
+
+
+def _dnn_decrypt(encrypted_array, password, dnn_seed, metadata=None, workers=None):
+    """DNN stage of decrypt_image, in parallel bands when metadata has checkpoints."""
+    num_neurons = len(password)
+    interval, states = 0, []
+    if metadata and CHECKPOINTS_KEY in metadata:
+        [interval, states] = decode_checkpoints(metadata[CHECKPOINTS_KEY])
+    return decrypt_rows(password, dnn_weights(dnn_seed, num_neurons), num_neurons,
+                        np.asarray(encrypted_array, dtype=np.uint8), interval, states, workers,
+                        network_class=IntegerDifferentialNeuralNetwork)
+
+
+def rekey_image(encrypted_array, old_password, new_password, checkpoint_interval=0, metadata=None,
+                new_metadata=None, workers=None):
+    """
+    Re-encrypts a v2 ciphertext under a new password: the inverse pipeline of
+    old_password and the forward pipeline of new_password back to back, with
+    the first substitutions fused (see _resubstitute_rows) so the plain image
+    is never built. The result equals
+    encrypt_image(decrypt_image(encrypted_array, old_password), new_password).
+    """
+    old_seeds = derive_seeds(old_password)
+    new_seeds = derive_seeds(new_password)
+
+    V = _dnn_decrypt(encrypted_array, old_password, old_seeds[3], metadata, workers)
+    perturbed_image = substitute_inv(V, old_seeds[2])
+    T = perturb_inv(perturbed_image, old_seeds[1])
+
+    T = _resubstitute_rows(T, _row_seeds(old_seeds[0], len(T)), _row_seeds(new_seeds[0], len(T)))
+
+    perturbed_image = perturb(T, new_seeds[1])
+    V = substitute(perturbed_image, new_seeds[2]).astype(np.uint8)
+    return _dnn_encrypt(V, new_password, new_seeds[3], checkpoint_interval, new_metadata)
+
+
+def _lane_states(seeds, num_rows):
+    """Forward and backward start states of every row of B images, each with its own seed."""
+    row_seeds = [_row_seeds(seed, num_rows) for seed in seeds]
+    return [np.concatenate([forward for forward, _ in row_seeds]),
+            np.concatenate([backward for _, backward in row_seeds])]
+
+
+def _substitute_lanes(images, seeds, inverse=False):
+    """substitute / substitute_inv of B images, each with its own seed, in one pass."""
+    B, N, M = images.shape
+    [forward_states, backward_states] = _lane_states(seeds, N)
+
+    blocks = images.reshape(B * N, M)
+    if inverse:
+        return _substitute_inv_rows(blocks, forward_states, backward_states).reshape(B, N, M)
+    return _substitute_rows(blocks, forward_states, backward_states).reshape(B, N, M)
+
+
+def encrypt_images_batch(image_arrays, passwords):
+    """
+    Encrypts several images of the same shape, with passwords of the same
+    length, in one vectorized pass. Each result equals encrypt_image.
+    """
+    images = np.asarray(image_arrays)
+    B, N, M = images.shape
+    seeds = [derive_seeds(password) for password in passwords]
+
+    T = _substitute_lanes(images, [s[0] for s in seeds])
+    perturbed_images = np.stack([perturb(T[b], seeds[b][1]) for b in range(B)])
+    V = _substitute_lanes(perturbed_images, [s[2] for s in seeds]).astype(np.uint8)
+
+    return _dnn_encrypt_batch(V, passwords, [s[3] for s in seeds])
+
+
+def _dnn_encrypt_batch(V, passwords, dnn_seeds):
+    """DNN stage of encrypt_images_batch."""
+    B, N, M = V.shape
+    num_neurons = len(passwords[0])
+    dnn = BatchedIntegerDifferentialNeuralNetwork(
+        passwords, [dnn_weights(seed, num_neurons) for seed in dnn_seeds], num_neurons=num_neurons)
+    C = np.empty((B, N, M), dtype=np.uint8)
+    for row_index in range(N):
+        v_rows = V[:, row_index, :]
+        C[:, row_index, :] = np.bitwise_xor(v_rows, dnn.generate_codes_and_update(v_rows))
+    return C
+
+
+def _dnn_decrypt_batch(encrypted, passwords, dnn_seeds):
+    """DNN stage of decrypt_images_batch."""
+    B, N, M = encrypted.shape
+    num_neurons = len(passwords[0])
+    dnn = BatchedIntegerDifferentialNeuralNetwork(
+        passwords, [dnn_weights(seed, num_neurons) for seed in dnn_seeds], num_neurons=num_neurons)
+    V = np.empty((B, N, M), dtype=np.uint8)
+    for row_index in range(N):
+        V[:, row_index, :] = dnn.recover_blocks_and_update(encrypted[:, row_index, :])
+    return V
+
+
+def decrypt_images_batch(encrypted_arrays, passwords):
+    """Decrypts several images in one vectorized pass, see encrypt_images_batch."""
+    encrypted = np.asarray(encrypted_arrays).astype(np.uint8)
+    B, N, M = encrypted.shape
+    seeds = [derive_seeds(password) for password in passwords]
+
+    V = _dnn_decrypt_batch(encrypted, passwords, [s[3] for s in seeds])
+    perturbed_images = _substitute_lanes(V, [s[2] for s in seeds], inverse=True)
+    T = np.stack([perturb_inv(perturbed_images[b], seeds[b][1]) for b in range(B)])
+    return _substitute_lanes(T, [s[0] for s in seeds], inverse=True).astype(np.uint8)
+
+
+def rekey_images_batch(encrypted_arrays, old_passwords, new_passwords):
+    """
+    Re-keys several images in one vectorized pass, like rekey_image: the first
+    substitutions of all images share one _resubstitute_rows pass. Images must
+    have the same shape, and the old and the new passwords the same length
+    among themselves.
+    """
+    encrypted = np.asarray(encrypted_arrays).astype(np.uint8)
+    B, N, M = encrypted.shape
+    old_seeds = [derive_seeds(password) for password in old_passwords]
+    new_seeds = [derive_seeds(password) for password in new_passwords]
+
+    V = _dnn_decrypt_batch(encrypted, old_passwords, [s[3] for s in old_seeds])
+    perturbed_images = _substitute_lanes(V, [s[2] for s in old_seeds], inverse=True)
+    T = np.stack([perturb_inv(perturbed_images[b], old_seeds[b][1]) for b in range(B)])
+
+    T = _resubstitute_rows(T.reshape(B * N, M), _lane_states([s[0] for s in old_seeds], N),
+                           _lane_states([s[0] for s in new_seeds], N)).reshape(B, N, M)
+
+    perturbed_images = np.stack([perturb(T[b], new_seeds[b][1]) for b in range(B)])
+    V = _substitute_lanes(perturbed_images, [s[2] for s in new_seeds]).astype(np.uint8)
+    return _dnn_encrypt_batch(V, new_passwords, [s[3] for s in new_seeds])
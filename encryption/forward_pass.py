@@ -73,7 +73,7 @@ def Substitute_Inv(out):
     d = np.int64(1)
 
     for ci in reversed(out):  # i = n down to 1
-        R = 17.32 * math.sqrt(d / (4 * f))
+        R = 17.32 * math.sqrt(abs(d) / (4 * abs(f) + 1e-9))
         k = int(R) % 256
         si = k ^ ci
         out1.insert(0, si)  # prepend to maintain order
@@ -85,7 +85,7 @@ def Substitute_Inv(out):
     d = np.int64(1)
 
     for si in out1:  # i = 1 to n
-        R = 17.32 * math.sqrt(d / (4 * f))
+        R = 17.32 * math.sqrt(abs(d) / (4 * abs(f) + 1e-9))
         k = int(R) % 256
         bi = k ^ si
         B.append(bi)
@@ -95,10 +95,6 @@ def Substitute_Inv(out):
 
 
 # %%
-# --- Global seeds (will be set inside perturbation) ---
-Seed_r = np.int64(0)
-Seed_c = np.int64(0)
-
 def Randomize(seed):
     """64-bit safe randomizer using xorshift pattern — avoids OverflowError."""
     # use unsigned 64-bit (np.uint64) for masking and bitwise operations
@@ -112,13 +108,14 @@ def Randomize(seed):
     # convert back to signed 64-bit for compatibility with np.int64 operations
     return np.int64(seed & mask)
 
-def Update(r: int, c: int, s: int, N: int, M: int):
+def Update(r: int, c: int, s: int, N: int, M: int, Seed_r, Seed_c):
     """
     Update row and column positions based on pixel value s (0..255).
-    Keeps everything in 64-bit range to avoid overflow.
-    """
-    global Seed_r, Seed_c
+    Keeps everything in 64-bit range to avoid overflow. The seeds are owned by
+    the calling Perturbation / Perturbation_Inv, so concurrent calls do not interfere.
 
+    Returns: (r_new, c_new, Seed_r, Seed_c)
+    """
     # Mix pixel into seeds
     Seed_r = np.int64(Seed_r ^ np.int64(s))
     Seed_c = np.int64(Seed_c ^ np.int64((s << 3) | (s >> 5)))
@@ -135,12 +132,19 @@ def Update(r: int, c: int, s: int, N: int, M: int):
     r_new = r_new % N
     c_new = c_new % M
 
-    return r_new, c_new
+    return r_new, c_new, Seed_r, Seed_c
+
 
+def _map_to_index(v, length):
+    """Maps a chaotic value (or an integer) to a start index in [0, length)."""
+    if isinstance(v, (float, np.floating)):
+        frac = v - math.floor(v)
+        return int((frac * length)) % length
+    else:
+        return int(v) % length
 
 # %%
 def Perturbation(Image: np.ndarray, r_init, c_init):
-    global Seed_r, Seed_c
     N, M = Image.shape  # works even if rectangular
 
     img = np.array(Image, copy=False)
@@ -151,13 +155,6 @@ def Perturbation(Image: np.ndarray, r_init, c_init):
     Seed_r = np.int64(0)
     Seed_c = np.int64(0)
 
-    def _map_to_index(v, length):
-        if isinstance(v, (float, np.floating)):
-            frac = v - math.floor(v)
-            return int((frac * length)) % length
-        else:
-            return int(v) % length
-
     r = _map_to_index(r_init, N)
     c = _map_to_index(c_init, M)
 
@@ -189,7 +186,7 @@ def Perturbation(Image: np.ndarray, r_init, c_init):
                         if outer_break:
                             break
 
-            r, c = Update(r, c, pixel, N, M)
+            r, c, Seed_r, Seed_c = Update(r, c, pixel, N, M, Seed_r, Seed_c)
 
     Image_p[Image_p == -1] = 0
     return Image_p.astype(img.dtype)
@@ -201,15 +198,16 @@ def Perturbation_Inv(Image_p , r, c):
     Image_p: N x N scrambled image
     Returns: restored Image
     """
+    Image_p = np.array(Image_p, dtype=int)  # work on a copy that can hold -1 markers
     N = Image_p.shape[0]
     M = Image_p.shape[1]
     Image = np.full((N, M), -1, dtype=int)  # initialize output
 
     # --- Initialize positions using same logistic map as forward ---
-  
+    r = _map_to_index(r, N)
+    c = _map_to_index(c, M)
 
-    # --- Reset global seeds ---
-    global Seed_r, Seed_c
+    # --- Initialize seeds ---
     Seed_r = np.int64(0)
     Seed_c = np.int64(0)
 
@@ -246,8 +244,195 @@ def Perturbation_Inv(Image_p , r, c):
             Image[i, j] = pixel
 
             # --- Update position using Update function ---
-            r, c = Update(r, c, Image[i, j], N , M)
+            r, c, Seed_r, Seed_c = Update(r, c, Image[i, j], N, M, Seed_r, Seed_c)
 
     return Image
 
 
+
+# %%
+# ---- Batched kernels: many independent blocks / images per vectorized pass ----
+def _update_df_batch(R, c, d):
+    """Vectorized update_df over lanes (R, c and d are 1-D arrays)."""
+    f = R.astype(np.int64)
+    z = c % 32
+    nonzero = z != 0
+    shift = np.where(nonzero, d % np.where(nonzero, z, 1), 0)
+    d = np.where(nonzero, (c << shift) ^ d, d ^ c)
+    d = d ^ (d << 21)
+    d = d ^ (d >> 35)
+    d = d ^ (d << 4)
+    return [f, d]
+
+
+def _substitution_key_batch(f, d):
+    R = 17.32 * np.sqrt(np.abs(d) / (4 * np.abs(f) + 1e-9))
+    return [R, R.astype(np.int64) % 256]
+
+
+def Substitute_Batch(blocks):
+    """
+    Substitute applied to every row of a 2-D array at once.
+    Each row is an independent lane; the result equals calling Substitute per row.
+    blocks: L x n array of pixel values
+    Returns: L x n int64 array
+    """
+    blocks = np.asarray(blocks, dtype=np.int64)
+    L, n = blocks.shape
+    out1 = np.empty_like(blocks)
+
+    # --- Forward pass ---
+    f = np.ones(L, dtype=np.int64)
+    d = np.ones(L, dtype=np.int64)
+    for j in range(n):
+        R, k = _substitution_key_batch(f, d)
+        out1[:, j] = k ^ blocks[:, j]
+        f, d = _update_df_batch(R, blocks[:, j], d)
+
+    # --- Backward pass ---
+    out = np.empty_like(blocks)
+    f = np.ones(L, dtype=np.int64)
+    d = np.ones(L, dtype=np.int64)
+    for j in reversed(range(n)):
+        R, k = _substitution_key_batch(f, d)
+        out[:, j] = k ^ out1[:, j]
+        f, d = _update_df_batch(R, out1[:, j], d)
+
+    return out
+
+
+def Substitute_Inv_Batch(blocks):
+    """
+    Substitute_Inv applied to every row of a 2-D array at once.
+    blocks: L x n array of encrypted blocks
+    Returns: L x n int64 array
+    """
+    blocks = np.asarray(blocks, dtype=np.int64)
+    L, n = blocks.shape
+    out1 = np.empty_like(blocks)
+
+    # --- Backward pass first ---
+    f = np.ones(L, dtype=np.int64)
+    d = np.ones(L, dtype=np.int64)
+    for j in reversed(range(n)):
+        R, k = _substitution_key_batch(f, d)
+        out1[:, j] = k ^ blocks[:, j]
+        f, d = _update_df_batch(R, out1[:, j], d)
+
+    # --- Forward pass second ---
+    B = np.empty_like(blocks)
+    f = np.ones(L, dtype=np.int64)
+    d = np.ones(L, dtype=np.int64)
+    for j in range(n):
+        R, k = _substitution_key_batch(f, d)
+        B[:, j] = k ^ out1[:, j]
+        f, d = _update_df_batch(R, B[:, j], d)
+
+    return B
+
+
+def _randomize_batch(seed):
+    """Vectorized Randomize on a uint64 array."""
+    seed = seed ^ (seed << np.uint64(21))
+    seed = seed ^ (seed >> np.uint64(35))
+    seed = seed ^ (seed << np.uint64(4))
+    return seed
+
+
+def _update_batch(r, c, s, seed_r, seed_c, N, M):
+    """Vectorized Update; seeds are uint64 arrays holding the int64 bit patterns."""
+    s = s.astype(np.uint64)
+    seed_r = _randomize_batch(seed_r ^ s)
+    seed_c = _randomize_batch(seed_c ^ ((s << np.uint64(3)) | (s >> np.uint64(5))))
+
+    r = ((seed_r.view(np.int64) % N) ^ r) % N
+    c = ((seed_c.view(np.int64) % M) ^ c) % M
+    return [r, c, seed_r, seed_c]
+
+
+def _first_in_column_batch(mask, lanes, c):
+    """
+    For each lane, the first row flagged in mask along column c, else the first
+    flagged position in column-major order (the search order of Perturbation).
+    Returns: [rows, cols]
+    """
+    N = mask.shape[1]
+    columns = mask[lanes, :, c[lanes]]
+    in_column = columns.any(axis=1)
+    rows = columns.argmax(axis=1)
+    cols = c[lanes].copy()
+
+    rest = np.nonzero(~in_column)[0]
+    if rest.size:
+        flat = mask[lanes[rest]].transpose(0, 2, 1).reshape(rest.size, -1)
+        idx = flat.argmax(axis=1)
+        rows[rest] = idx % N
+        cols[rest] = idx // N
+    return [rows, cols]
+
+
+def Perturbation_Batch(Images, r_inits, c_inits):
+    """
+    Perturbation of B images of the same shape in one pass, one lane per image.
+    Images: B x N x M array
+    r_inits, c_inits: per image start values, as passed to Perturbation
+    Returns: B x N x M array equal to calling Perturbation per image
+    """
+    Images = np.asarray(Images)
+    B, N, M = Images.shape
+    pixels = Images.astype(np.int64)
+    Image_p = np.zeros((B, N, M), dtype=np.int64)
+    free = np.ones((B, N, M), dtype=bool)
+    lanes = np.arange(B)
+
+    r = np.array([_map_to_index(v, N) for v in r_inits], dtype=np.int64)
+    c = np.array([_map_to_index(v, M) for v in c_inits], dtype=np.int64)
+    seed_r = np.zeros(B, dtype=np.uint64)
+    seed_c = np.zeros(B, dtype=np.uint64)
+
+    for i in range(N):
+        for j in range(M):
+            pixel = pixels[:, i, j]
+
+            occupied = np.nonzero(~free[lanes, r, c])[0]
+            if occupied.size:
+                r[occupied], c[occupied] = _first_in_column_batch(free, occupied, c)
+
+            Image_p[lanes, r, c] = pixel
+            free[lanes, r, c] = False
+
+            r, c, seed_r, seed_c = _update_batch(r, c, pixel, seed_r, seed_c, N, M)
+
+    return Image_p.astype(Images.dtype)
+
+
+def Perturbation_Inv_Batch(Images_p, r_inits, c_inits):
+    """
+    Perturbation_Inv of B scrambled images of the same shape in one pass.
+    Images_p: B x N x M array
+    Returns: B x N x M int array equal to calling Perturbation_Inv per image
+    """
+    Images_p = np.asarray(Images_p, dtype=np.int64)
+    B, N, M = Images_p.shape
+    Image = np.zeros((B, N, M), dtype=np.int64)
+    available = np.ones((B, N, M), dtype=bool)
+    lanes = np.arange(B)
+
+    r = np.array([_map_to_index(v, N) for v in r_inits], dtype=np.int64)
+    c = np.array([_map_to_index(v, M) for v in c_inits], dtype=np.int64)
+    seed_r = np.zeros(B, dtype=np.uint64)
+    seed_c = np.zeros(B, dtype=np.uint64)
+
+    for i in range(N):
+        for j in range(M):
+            taken = np.nonzero(~available[lanes, r, c])[0]
+            if taken.size:
+                r[taken], c[taken] = _first_in_column_batch(available, taken, c)
+
+            pixel = Images_p[lanes, r, c]
+            available[lanes, r, c] = False
+            Image[:, i, j] = pixel
+
+            r, c, seed_r, seed_c = _update_batch(r, c, pixel, seed_r, seed_c, N, M)
+
+    return Image